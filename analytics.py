@@ -0,0 +1,80 @@
+import re
+import numpy as np
+import pandas as pd
+from metric_record import NAME_METRIC, DERIVED_METRICS, MetricRecord
+
+#原本在EXCEL用公式逐列計算的衍生指標，改成爬蟲結束後對所有股票一次算完
+#records先轉成 股票 × 欄位 的float矩陣，每個指標都是整欄運算，不逐檔跑迴圈
+#算出來的值一樣包成MetricRecord，跟原始資料一起交給EXCEL/google sheet寫入端
+
+_EPS_YEAR_RE = re.compile(r"^EPS\((\d{4})\)$")
+
+
+def metric_frame(records):
+    #records → DataFrame(index=股票代碼, columns=record.column)，無法解析的值為NaN
+    frame = pd.DataFrame(
+        [(r.ticker, r.column, np.nan if r.value is None else r.value) for r in records if r.metric != NAME_METRIC],
+        columns=["ticker", "column", "value"],
+    )
+    frame = frame.drop_duplicates(["ticker", "column"], keep="last")
+    return frame.pivot(index="ticker", columns="column", values="value").astype(float)
+
+
+def eps_cagr(frame):
+    #各股票最早到最新一個有值的會計年度EPS年複合成長率，頭尾任一個不是正數時無意義(NaN)
+    columns = sorted((int(m.group(1)), c) for c in frame.columns if (m := _EPS_YEAR_RE.match(c)))
+    if len(columns) < 2:
+        return pd.Series(np.nan, index=frame.index)
+    years = np.array([year for year, _ in columns])
+    matrix = frame[[c for _, c in columns]].to_numpy()
+    valid = ~np.isnan(matrix)
+    first = valid.argmax(axis=1)
+    last = matrix.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    rows = np.arange(matrix.shape[0])
+    start, end = matrix[rows, first], matrix[rows, last]
+    span = years[last] - years[first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where((span > 0) & (start > 0) & (end > 0), (end / start) ** (1 / span) - 1, np.nan)
+    return pd.Series(cagr, index=frame.index)
+
+
+def derived_frame(records):
+    #回傳 DataFrame(index=股票代碼, columns=DERIVED_METRICS)
+    frame = metric_frame(records)
+
+    def col(name):
+        return frame[name] if name in frame.columns else pd.Series(np.nan, index=frame.index)
+
+    #市值直接取overview的Market Cap，現價 = 市值 / 流通股數
+    market_cap = col("Market Cap").where(col("Market Cap") > 0)
+    price = market_cap / col("SharesOut").where(col("SharesOut") > 0)
+    fcf = col("Free Cash Flow(TTM)")
+    result = pd.DataFrame({
+        "Upside": col("Price Target") / price - 1,
+        "FCF Yield": fcf / market_cap,
+        #自由現金流是負的時候，負債/FCF沒有意義
+        "Debt/FCF": col("Total Debt(TTM)") / fcf.where(fcf > 0),
+        "EPS CAGR": eps_cagr(frame),
+    }, index=frame.index)
+    return result.replace([np.inf, -np.inf], np.nan)
+
+
+def _format(metric, value):
+    if metric == "Debt/FCF":
+        return f"{value:.2f}"
+    return f"{value * 100:.2f}%"
+
+
+def compute_derived(records):
+    #回傳衍生指標的MetricRecord陣列，算不出來的值text為"-"
+    if not records:
+        return []
+    result = derived_frame(records)
+    derived = []
+    for ticker, values in zip(result.index, result.itertuples(index=False)):
+        for metric, value in zip(DERIVED_METRICS, values):
+            if np.isnan(value):
+                derived.append(MetricRecord(ticker, metric, "", "-"))
+            else:
+                derived.append(MetricRecord(ticker, metric, "", _format(metric, value), float(value)))
+    return derived
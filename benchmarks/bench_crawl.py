@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_server import StubSite, start_server, add_site_arguments, site_from_args
+
+#離線的整體爬蟲benchmark：啟動本機的假網站，用真正的crawl_codes → fetch_stock_data → safe_request爬N檔假代碼
+#用法：python benchmarks/bench_crawl.py [--tickers 100] [--workers 8] [--latency 50 --jitter 20]
+#                                      [--burst-every 10 --burst-length 1] [--malformed 0.05]
+#                                      [--save baseline.json] [--compare baseline.json]
+#輸出tickers/s、每檔耗時p50/p99、RSS峰值與request/429計數；--save存成基準，之後用--compare比較
+#HTTP快取固定關閉，每次都真的打到假網站；限速器使用config的設定，可用--rate覆寫速度(同時作為上限)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+class PeakMemory:
+    #背景執行緒定期取樣RSS，記錄最大值
+    def __init__(self, interval=0.01):
+        import psutil
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline crawl benchmark against a local stand-in site")
+    parser.add_argument("--tickers", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="預設使用config的MAX_CRAWL_WORKERS")
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=None, help="覆寫限速器的速度與上限(req/s)")
+    parser.add_argument("--save", help="把結果存成基準檔")
+    parser.add_argument("--compare", help="跟之前存下來的基準檔比較")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_args(args)
+    server = start_server(site)
+    host, port = server.server_address[:2]
+    #config在import時讀取網址，所以要在import爬蟲模組之前設定
+    os.environ["USSTOCKSYNC_SITE_URL"] = f"http://{host}:{port}"
+
+    from config import MAX_CRAWL_WORKERS
+    from crawler import crawl_codes
+    from metric_record import OVERVIEW_METRICS
+    from http_cache import set_cache_bypass
+    from rate_limiter import get_limiter
+    from run_metrics import get_metrics
+
+    set_cache_bypass(True)
+    if args.rate:
+        limiter = get_limiter(f"{host}:{port}")
+        limiter.rate = limiter.max_rate = args.rate
+    workers = args.workers or MAX_CRAWL_WORKERS
+    codes = [f"T{i:04d}" for i in range(args.tickers)]
+    metrics = get_metrics()
+    metrics.reset()
+
+    print(f"{args.tickers} tickers, {workers} workers, parse_workers={args.parse_workers}, "
+          f"latency={args.latency:.0f}ms+{args.jitter:.0f}ms, burst={args.burst_every}s/{args.burst_length}s, "
+          f"malformed={args.malformed:.0%}")
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        results = crawl_codes(codes, max_workers=workers, parse_workers=args.parse_workers)
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    data = metrics.to_dict()
+    latencies = [stages.get("ticker_total", 0.0) for stages in data["tickers"].values()]
+    failed = sum(1 for r in results if not r.ok)
+    #overview值無法解析成數字代表表格沒解析到(壞掉的頁面)
+    incomplete = sum(1 for r in results if r.ok and any(
+        rec.value is None for rec in r.records if rec.metric in OVERVIEW_METRICS))
+    report = {
+        "tickers": args.tickers,
+        "seconds": round(elapsed, 3),
+        "tickers_per_s": round(args.tickers / elapsed, 2),
+        "p50": round(percentile(latencies, 50), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "peak_rss_mb": round(memory.peak / 1024 / 1024, 1),
+        "requests": data["counters"].get("requests", 0),
+        "http_429": data["counters"].get("http_429", 0),
+        "failed": failed,
+        "incomplete": incomplete,
+    }
+
+    for key, value in report.items():
+        print(f"{key:<16}{value:>12}")
+    print("slowest stages: " + ", ".join(
+        f"{stage} {s['total']:.2f}s" for stage, s in
+        sorted(data["stages"].items(), key=lambda item: -item[1]["total"]) if stage != "ticker_total"
+    ))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        print(f"\nvs {args.compare}")
+        for key in ("tickers_per_s", "p50", "p99", "peak_rss_mb"):
+            if baseline.get(key):
+                change = (report[key] - baseline[key]) / baseline[key]
+                print(f"{key:<16}{baseline[key]:>12} → {report[key]:<10}{change:+.1%}")
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import datetime
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import openpyxl
+from data_fetcher import write_to_excel, get_next_available_row
+from metric_record import build_records, DERIVED_METRICS
+
+#比較write_to_excel原本逐列掃描的寫法與建立索引後的寫法
+#用法：python benchmarks/bench_excel_write.py [--rows 5000] [--tickers 500]
+#工作表先放rows列既有資料，再寫入tickers檔(一半已存在、一半新代碼)
+
+HEADERS = ["股票代碼", "公司名稱", "SharesOut", "PE Ratio", "Price Target",
+           "EPS(TTM)", "EPS(2024)", "EPS(2023)", "Free Cash Flow(TTM)", "Free Cash Flow(2024)",
+           "Total Debt(TTM)", "Total Debt(2024)", "更新時間"]
+#write_to_excel會把標題中還沒有的Market Cap與衍生指標欄位加在最後一欄之後
+APPEND_HEADERS = ["Market Cap", *DERIVED_METRICS]
+
+
+def make_workbook(path, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Crawl_data"
+    ws.append(HEADERS)
+    for i in range(rows):
+        ws.append([f"T{i:05d}", f"Company {i}", "1.00B", "10.00", "100.00"] + ["-"] * (len(HEADERS) - 5))
+    wb.save(path)
+
+
+def make_data(rows, tickers):
+    data_rows = []
+    extra = {}
+    for i in range(tickers):
+        #偶數取既有代碼(分散在整張表)，奇數為新代碼
+        code = f"T{(i * rows // tickers):05d}" if i % 2 == 0 else f"N{i:05d}"
+        data_rows.append((code, "2.00B", "12.00", "120.00", "240.00B"))
+        extra[code] = {
+            "公司名稱": f"Company {code}",
+            "EPS (Basic) (TTM)": "1.23", "EPS (Basic) (FY 2024)": "1.11", "EPS (Basic) (FY 2023)": "1.01",
+            "Free Cash Flow (TTM)": "1,234", "Free Cash Flow (FY 2024)": "1,111",
+            "Total Debt (TTM)": "5,678", "Total Debt (FY 2024)": "5,555",
+        }
+    return data_rows, extra
+
+
+def baseline_write(path, data_rows, extra_data_dict):
+    #原本的寫法：每一檔都從第2列掃到最後一列找代碼，找不到再掃一次找空白列，動態欄位每次重新解析
+    wb = openpyxl.load_workbook(path)
+    ws = wb["Crawl_data"]
+    header = {cell.value: cell.column for cell in ws[1] if isinstance(cell.value, str)}
+    for name in APPEND_HEADERS:
+        header[name] = ws.max_column + 1
+        ws.cell(row=1, column=header[name], value=name)
+    for code, shares, pe, price_target, market_cap in data_rows:
+        found_row = None
+        for row in range(2, ws.max_row + 1):
+            if str(ws.cell(row=row, column=header.get("股票代碼", 1)).value).strip().upper() == code.strip().upper():
+                found_row = row
+                break
+        row = found_row if found_row else get_next_available_row(ws)
+        ws.cell(row=row, column=header.get("股票代碼", 1), value=code)
+        ws.cell(row=row, column=header.get("SharesOut", 3), value=shares)
+        ws.cell(row=row, column=header.get("PE Ratio", 4), value=pe)
+        ws.cell(row=row, column=header.get("Price Target", 5), value=price_target)
+        ws.cell(row=row, column=header["Market Cap"], value=market_cap)
+        #衍生指標由analytics另外算，這裡的records沒有，寫"-"
+        for name in DERIVED_METRICS:
+            ws.cell(row=row, column=header[name], value="-")
+        raw_data = extra_data_dict.get(code, {})
+        for col_name in header:
+            for prefix, label in (("EPS", "EPS (Basic)"), ("Free Cash Flow", "Free Cash Flow"), ("Total Debt", "Total Debt")):
+                if col_name.startswith(prefix):
+                    if "TTM" in col_name:
+                        key = f"{label} (TTM)"
+                    else:
+                        key = f"{label} (FY {col_name[col_name.find('(')+1:col_name.find(')')]})"
+                    ws.cell(row=row, column=header.get("公司名稱", 2), value=raw_data.get("公司名稱", "-"))
+                    ws.cell(row=row, column=header[col_name], value=raw_data.get(key, "-"))
+        ws.cell(row=row, column=header.get("更新時間", 11), value=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    wb.save(path)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24}{elapsed:>10.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="write_to_excel benchmark")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--tickers", type=int, default=500)
+    args = parser.parse_args()
+
+    data_rows, extra = make_data(args.rows, args.tickers)
+    with tempfile.TemporaryDirectory() as tmp:
+        base_path = Path(tmp) / "baseline.xlsx"
+        new_path = Path(tmp) / "indexed.xlsx"
+        make_workbook(base_path, args.rows)
+        make_workbook(new_path, args.rows)
+        print(f"{args.rows} existing rows, {args.tickers} tickers")
+
+        base = timed("baseline (scan)", lambda: baseline_write(base_path, data_rows, extra))
+        records = [r for row in data_rows for r in build_records(row, extra[row[0]])]
+        new = timed("indexed", lambda: write_to_excel(records, file_path=new_path))
+        print(f"speedup x{base / new:.1f}")
+
+        #兩種寫法的結果應該一致(更新時間除外)
+        skip = HEADERS.index("更新時間")
+        a = [row[:skip] + row[skip + 1:] for row in openpyxl.load_workbook(base_path)["Crawl_data"].iter_rows(values_only=True)]
+        b = [row[:skip] + row[skip + 1:] for row in openpyxl.load_workbook(new_path)["Crawl_data"].iter_rows(values_only=True)]
+        print("results match" if a == b else "⚠️ results differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from data_fetcher import extract_page
+from page_parser import BACKENDS
+from sample_pages import PAGES
+
+#比較在單一process中解析與交給1~N個process解析同一批頁面的耗時
+#用法：python benchmarks/bench_parse_pool.py [--tickers 200] [--max-workers 核心數] [--backend bs4]
+#每個worker只傳回抽出來的小dict，跟爬蟲中PageBundle.extracted的用法一樣
+
+
+def make_pages(tickers):
+    pages = []
+    for i in range(tickers):
+        code = f"T{i:04d}"
+        for page in ("overview", "financials", "balance_sheet"):
+            pages.append((page, PAGES[page](code, seed=i), code))
+    return pages
+
+
+def run_serial(pages, backend):
+    return [extract_page(page, html, code, backend) for page, html, code in pages]
+
+
+def run_pool(pages, backend, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        #先讓每個process啟動並載入模組，計時只算解析
+        list(pool.map(int, range(workers)))
+        start = time.perf_counter()
+        futures = [pool.submit(extract_page, page, html, code, backend) for page, html, code in pages]
+        results = [f.result() for f in futures]
+        return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process pool HTML parsing benchmark")
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", choices=list(BACKENDS), default=None)
+    args = parser.parse_args()
+
+    pages = make_pages(args.tickers)
+    print(f"{len(pages)} pages, backend={args.backend or 'config'}, {os.cpu_count()} cores")
+
+    start = time.perf_counter()
+    expected = run_serial(pages, args.backend)
+    base = time.perf_counter() - start
+    print(f"{'in-process':<16}{base:>10.3f}s")
+
+    #1, 2, 4, ... 再加上最大值
+    sizes = sorted({2 ** i for i in range(args.max_workers.bit_length()) if 2 ** i <= args.max_workers} | {args.max_workers})
+    for workers in sizes:
+        results, elapsed = run_pool(pages, args.backend, workers)
+        match = "" if results == expected else "  ⚠️ results differ"
+        print(f"{f'{workers} process':<16}{elapsed:>10.3f}s   x{base / elapsed:.2f}{match}")
+
+
+if __name__ == "__main__":
+    main()
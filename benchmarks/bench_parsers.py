@@ -0,0 +1,105 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup
+from page_parser import BACKENDS, ParsedPage, get_backend
+from data_fetcher import extract_overview_metrics, extract_table_rows
+from sample_pages import PAGES
+
+#比較原本的BeautifulSoup(html.parser)寫法與各解析後端在同一批頁面上的耗時
+#用法：python benchmarks/bench_parsers.py [--pages-dir 存下來的頁面資料夾] [--repeat 20]
+#資料夾中的檔名需以overview / financials / balance開頭，沒給資料夾時使用sample_pages產生的假頁面
+
+
+def baseline_overview(html):
+    #原本fetch_overview_metrics的解析方式：整頁建樹，每個td呼叫兩次get_text
+    soup = BeautifulSoup(html, "html.parser")
+    tds = soup.find_all("td")
+    out = {}
+    for i in range(len(tds) - 1):
+        lbl = tds[i].get_text(strip=True)
+        val = tds[i+1].get_text(strip=True)
+        if lbl.startswith(("Shares Out", "PE Ratio", "Price Target")):
+            out[lbl] = val
+    return out
+
+
+def baseline_table(html, labels):
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table")
+    data = {}
+    years = [th.get_text(strip=True) for th in table.thead.find_all("th")][1:]
+    for tr in table.tbody.find_all("tr"):
+        cols = [td.get_text(strip=True) for td in tr.find_all("td")]
+        if cols and cols[0] in labels:
+            for yr, val in zip(years, cols[1:]):
+                data[f"{cols[0]} ({yr})"] = val
+    return data
+
+
+LABELS = ["EPS (Basic)", "Free Cash Flow", "Total Debt"]
+
+
+def load_pages(pages_dir):
+    pages = []
+    if pages_dir:
+        for path in sorted(Path(pages_dir).glob("*.htm*")):
+            kind = "overview" if path.name.startswith("overview") else "table"
+            pages.append((kind, path.read_text(encoding="utf-8", errors="replace")))
+        return pages
+    for code in ["AAPL", "MSFT", "NVDA", "GOOGL", "AMZN"]:
+        pages.append(("overview", PAGES["overview"](code)))
+        pages.append(("table", PAGES["financials"](code)))
+        pages.append(("table", PAGES["balance_sheet"](code)))
+    return pages
+
+
+def run(label, fn, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for kind, html in pages:
+            fn(kind, html)
+    elapsed = time.perf_counter() - start
+    per_page = elapsed / (repeat * len(pages)) * 1000
+    print(f"{label:<28}{elapsed:>10.3f}s{per_page:>12.3f} ms/page")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML parser backend benchmark")
+    parser.add_argument("--pages-dir", default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages_dir)
+    if not pages:
+        print("沒有可用的頁面")
+        return
+    print(f"{len(pages)} pages x {args.repeat} repeats")
+
+    def baseline(kind, html):
+        return baseline_overview(html) if kind == "overview" else baseline_table(html, LABELS)
+
+    base = run("baseline (html.parser)", baseline, pages, args.repeat)
+
+    for name in BACKENDS:
+        try:
+            backend = get_backend(name)
+        except ImportError:
+            print(f"{name:<28}{'not installed':>10}")
+            continue
+
+        def targeted(kind, html, backend=backend):
+            page = ParsedPage(html, backend)
+            return extract_overview_metrics(page) if kind == "overview" else extract_table_rows(page, LABELS)
+
+        elapsed = run(f"{name} (targeted)", targeted, pages, args.repeat)
+        print(f"{'':<28}speedup x{base / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
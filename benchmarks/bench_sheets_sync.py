@@ -0,0 +1,94 @@
+import argparse
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_sheets import FakeSheetsBackend
+from metric_record import build_records
+
+#量測sync.py寫入google sheet時送出的API次數、資料量與耗時，使用記憶體版的後端，不需要網路與金鑰
+#用法：python benchmarks/bench_sheets_sync.py [--sizes 10 100 1000] [--latency 200] [--quota 60]
+#每個數量依序跑：第一次寫入(空白分頁)、資料不變、約一成股價變動、本地快照失效後重寫，以及Group分頁同步
+#每一輪的「更新時間」都往後推一分鐘，跟實際隔一段時間再同步一樣，資料不變時仍要寫回每一列的更新時間
+
+SPREADSHEET_ID = "bench"
+
+
+def make_data(tickers, version=0, changed=0.0):
+    data_rows = []
+    extra = {}
+    for i in range(tickers):
+        code = f"T{i:04d}"
+        #前changed比例的代碼使用新的股價
+        price = 100 + i + (version if i < tickers * changed else 0)
+        data_rows.append((code, f"{1 + i / 100:.2f}B", f"{10 + i % 30:.2f}", f"{price:.2f}"))
+        extra[code] = {"公司名稱": f"Company {i}"}
+        for year in ("TTM", "FY 2024", "FY 2023", "FY 2022"):
+            extra[code][f"EPS (Basic) ({year})"] = f"{(i % 50) / 10:.2f}"
+            extra[code][f"Free Cash Flow ({year})"] = f"{i * 10:,}"
+            extra[code][f"Total Debt ({year})"] = f"{i * 20:,}"
+    return [record for row in data_rows for record in build_records(row, extra[row[0]])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Google Sheets sync API-call benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.0, help="每次API呼叫的延遲(毫秒)")
+    parser.add_argument("--quota", type=int, default=None, help="每分鐘可呼叫次數，超過回429")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        #本地快照放在暫存資料夾，不影響實際使用的APPDATA
+        os.environ["APPDATA"] = tmp
+        from sheet_backend import set_sheet_backend
+        from sync import smart_write_to_google_sheet, sync_group_to_google_sheet, invalidate_sheet_snapshot
+
+        print(f"latency={args.latency:.0f}ms quota={args.quota or '-'}/min")
+        print(f"{'tickers':>8}  {'scenario':<12}{'reads':>7}{'writes':>8}{'429':>6}{'KB':>10}{'seconds':>10}  ok")
+        for size in args.sizes:
+            backend = FakeSheetsBackend(quota_per_minute=args.quota, latency=args.latency / 1000)
+            set_sheet_backend(backend)
+            invalidate_sheet_snapshot(SPREADSHEET_ID, "Crawl_data")
+
+            clock = itertools.count()
+
+            def crawl_data(records):
+                timestamp = (datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=next(clock))).strftime("%Y-%m-%d %H:%M:%S")
+                return smart_write_to_google_sheet(records, spreadsheet_id=SPREADSHEET_ID, sheet_name="Crawl_data",
+                                                   log_fn=lambda msg: None, timestamp=timestamp).result()
+
+            def group_sync():
+                groups = {f"Group {g}": [f"T{i:04d}" for i in range(g, size, 5)] for g in range(5)}
+                return sync_group_to_google_sheet(groups, SPREADSHEET_ID, log_fn=lambda msg: None).result()
+
+            def cold(records):
+                invalidate_sheet_snapshot(SPREADSHEET_ID, "Crawl_data")
+                return crawl_data(records)
+
+            scenarios = [
+                ("initial", lambda: crawl_data(make_data(size))),
+                ("unchanged", lambda: crawl_data(make_data(size))),
+                ("10% changed", lambda: crawl_data(make_data(size, version=1, changed=0.1))),
+                ("cold", lambda: cold(make_data(size, version=1, changed=0.1))),
+                ("group sync", group_sync),
+            ]
+            for label, fn in scenarios:
+                backend.reset_calls()
+                start = time.perf_counter()
+                ok = fn()
+                elapsed = time.perf_counter() - start
+                s = backend.summary()
+                print(f"{size:>8}  {label:<12}{s['read']:>7}{s['write']:>8}{s['rejected']:>6}"
+                      f"{s['bytes'] / 1024:>10.1f}{elapsed:>10.3f}  {'✓' if ok else '✗'}")
+        set_sheet_backend(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+
+import requests
+from gspread.exceptions import APIError
+
+#記憶體版的google sheet後端(介面見sheet_backend.py)，給benchmark量測sync.py送了幾次API、多少資料
+#每次呼叫都記在calls：(方法, "read"/"write", 送出+收到的JSON位元組數)
+#quota_per_minute限制一分鐘內的呼叫次數，超過時跟Google一樣回429(APIError)；latency為每次呼叫的延遲(秒)
+
+_CELL_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+
+def _parse_range(a1):
+    #"A1"、"B3:D3" → (起始列, 起始欄)，皆從0開始
+    match = _CELL_RE.match(a1.split(":")[0])
+    return int(match.group(2)) - 1, _col_index(match.group(1))
+
+
+def _size(payload):
+    return len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def _quota_error():
+    resp = requests.Response()
+    resp.status_code = 429
+    resp._content = json.dumps({"error": {
+        "code": 429, "status": "RESOURCE_EXHAUSTED",
+        "message": "Quota exceeded for quota metric 'Requests' per minute",
+    }}).encode("utf-8")
+    return APIError(resp)
+
+
+class FakeSheetsBackend:
+    def __init__(self, quota_per_minute=None, latency=0.0):
+        self.quota_per_minute = quota_per_minute
+        self.latency = latency
+        self.sheets = {}            # (spreadsheet_id, sheet_name) → FakeWorksheet
+        self.calls = []
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _call(self, method, kind, payload=None, result=None):
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if self.quota_per_minute is not None and len(self._recent) >= self.quota_per_minute:
+                self.calls.append((method, "rejected", 0))
+                raise _quota_error()
+            self._recent.append(now)
+            self.calls.append((method, kind, _size(payload) + _size(result)))
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_worksheet(self, spreadsheet_id, sheet_name, rows=1000, cols=40):
+        self._call("open_worksheet", "read")
+        key = (spreadsheet_id, sheet_name)
+        if key not in self.sheets:
+            self.sheets[key] = FakeWorksheet(self, sheet_name)
+        return self.sheets[key]
+
+    def forget(self, spreadsheet_id, sheet_name):
+        pass
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = []
+
+    def summary(self):
+        #{"read": 次數, "write": 次數, "rejected": 次數, "bytes": 總位元組}
+        result = {"read": 0, "write": 0, "rejected": 0, "bytes": 0}
+        for _, kind, size in self.calls:
+            result[kind] += 1
+            result["bytes"] += size
+        return result
+
+
+class FakeWorksheet:
+    def __init__(self, backend, title):
+        self._backend = backend
+        self.title = title
+        self.rows = []
+
+    def _write(self, row, col, values):
+        for r, line in enumerate(values):
+            while len(self.rows) <= row + r:
+                self.rows.append([])
+            target = self.rows[row + r]
+            while len(target) < col + len(line):
+                target.append("")
+            for c, value in enumerate(line):
+                target[col + c] = "" if value is None else str(value)
+
+    def _last_row(self):
+        last = len(self.rows)
+        while last and not any(self.rows[last - 1]):
+            last -= 1
+        return last
+
+    def get_all_values(self):
+        result = [list(row) for row in self.rows[:self._last_row()]]
+        self._backend._call("get_all_values", "read", result=result)
+        return result
+
+    def col_values(self, col):
+        #跟gspread一樣只回傳到該欄最後一個有值的儲存格
+        result = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+        while result and not result[-1]:
+            result.pop()
+        self._backend._call("col_values", "read", result=result)
+        return result
+
+    def append_row(self, values):
+        self.append_rows([values])
+
+    def append_rows(self, rows, table_range=None, **kwargs):
+        self._backend._call("append_rows", "write", payload=rows)
+        self._write(self._last_row(), 0, rows)
+
+    def update(self, range_name, values):
+        self._backend._call("update", "write", payload=values)
+        self._write(*_parse_range(range_name), values)
+
+    def batch_update(self, data):
+        self._backend._call("batch_update", "write", payload=data)
+        for item in data:
+            self._write(*_parse_range(item["range"]), item["values"])
+
+    def clear(self):
+        self._backend._call("clear", "write")
+        self.rows = []
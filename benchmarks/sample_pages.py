@@ -0,0 +1,94 @@
+import random
+
+#產生跟stockanalysis.com結構相近的假頁面(overview / financials / balance sheet)，給離線benchmark使用
+#頁面中塞了大量跟目標無關的區塊，模擬真實頁面的體積
+
+YEARS = ["TTM", "FY 2024", "FY 2023", "FY 2022", "FY 2021", "FY 2020"]
+
+FINANCIAL_LABELS = [
+    "Revenue", "Revenue Growth (YoY)", "Cost of Revenue", "Gross Profit", "Selling, General & Admin",
+    "Research & Development", "Operating Expenses", "Operating Income", "Interest Expense", "Pretax Income",
+    "Income Tax", "Net Income", "Shares Outstanding (Basic)", "EPS (Basic)", "EPS (Diluted)",
+    "Free Cash Flow", "Free Cash Flow Per Share", "Dividend Per Share", "Gross Margin", "Operating Margin",
+    "Profit Margin", "Free Cash Flow Margin", "EBITDA", "EBIT", "Total Debt",
+]
+
+BALANCE_LABELS = [
+    "Cash & Equivalents", "Short-Term Investments", "Receivables", "Inventory", "Total Current Assets",
+    "Property, Plant & Equipment", "Goodwill", "Total Assets", "Accounts Payable", "Current Debt",
+    "Long-Term Debt", "Total Liabilities", "Total Debt", "Shareholders' Equity", "Net Cash (Debt)",
+]
+
+
+def _padding(rng, blocks=200):
+    #無關的導覽列、文章與script區塊
+    parts = []
+    for i in range(blocks):
+        parts.append(
+            f'<div class="nav-item"><a href="/stocks/x{i}/">Link {i}</a>'
+            f'<span class="muted">{rng.random():.6f}</span></div>'
+        )
+    parts.append("<script>window.__data = " + ",".join(str(rng.random()) for _ in range(500)) + ";</script>")
+    return "\n".join(parts)
+
+
+def overview_page(code, seed=0, malformed=False):
+    rng = random.Random(f"{code}-{seed}")
+    #市值 = 流通股數 × 現價，目標價 = 現價 × (1 + 漲幅)，讓衍生指標算出來的數字合理
+    shares = rng.uniform(0.1, 16)
+    price = rng.uniform(10, 500)
+    upside = rng.uniform(-10, 40)
+    rows = [
+        ("Market Cap", f"{shares * price:.2f}B"),
+        ("Revenue (ttm)", f"{rng.uniform(1, 400):.2f}B"),
+        ("Net Income (ttm)", f"{rng.uniform(-5, 90):.2f}B"),
+        ("Shares Out", f"{shares:.2f}B"),
+        ("EPS (ttm)", f"{rng.uniform(-3, 12):.2f}"),
+        ("PE Ratio", f"{rng.uniform(5, 80):.2f}"),
+        ("Dividend", "n/a"),
+        ("Price Target", f"{price * (1 + upside / 100):.2f} ({upside:+.2f}%)"),
+        ("Volume", f"{rng.randint(10000, 90000000):,}"),
+    ]
+    cells = "".join(f"<tr><td>{label}</td><td><span>{value}</span></td></tr>" for label, value in rows)
+    table = "" if malformed else f"<table><tbody>{cells}</tbody></table>"
+    return (
+        f"<html><head><title>Example Corp. ({code}) Stock Price &amp; Overview</title></head><body>"
+        f"{_padding(rng)}{table}{_padding(rng, 50)}</body></html>"
+    )
+
+
+def _statement_page(code, labels, seed, malformed):
+    rng = random.Random(f"{code}-{labels[0]}-{seed}")
+    head = "<th>Fiscal Year</th>" + "".join(f"<th>{y}</th>" for y in YEARS)
+    body = []
+    for label in labels:
+        vals = []
+        for _ in YEARS:
+            if label.startswith("EPS") or label.endswith("Per Share"):
+                vals.append(f"{rng.uniform(-2, 12):.2f}")
+            elif "Margin" in label or "Growth" in label:
+                vals.append(f"{rng.uniform(-20, 60):.2f}%")
+            else:
+                vals.append(f"{rng.uniform(-5000, 400000):,.0f}")
+        body.append(f"<tr><td><a>{label}</a></td>" + "".join(f"<td>{v}</td>" for v in vals) + "</tr>")
+    if malformed:
+        #少了thead，模擬版面改版或被截斷的表格
+        table = "<table><tbody>" + "".join(body[:3]) + "</tbody></table>"
+    else:
+        table = f"<table><thead><tr>{head}</tr></thead><tbody>{''.join(body)}</tbody></table>"
+    return f"<html><head><title>{code} Financials</title></head><body>{_padding(rng)}{table}</body></html>"
+
+
+def financials_page(code, seed=0, malformed=False):
+    return _statement_page(code, FINANCIAL_LABELS, seed, malformed)
+
+
+def balance_sheet_page(code, seed=0, malformed=False):
+    return _statement_page(code, BALANCE_LABELS, seed, malformed)
+
+
+PAGES = {
+    "overview": overview_page,
+    "financials": financials_page,
+    "balance_sheet": balance_sheet_page,
+}
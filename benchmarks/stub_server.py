@@ -0,0 +1,129 @@
+import argparse
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sample_pages import PAGES
+
+#本機的stockanalysis.com替身，給離線benchmark使用
+#提供 /stocks/<代碼>/、/stocks/<代碼>/financials/、/stocks/<代碼>/financials/balance-sheet/ 三種頁面
+#頁面由sample_pages依代碼產生後存在記憶體(同一個代碼每次內容相同，就像錄下來的頁面)
+#可模擬延遲、週期性的429爆量，以及一定比例的壞掉表格；__data.json一律404，讓爬蟲走HTML解析
+#單獨執行：python benchmarks/stub_server.py --port 8765 --latency 50
+
+_ROUTES = [
+    (re.compile(r"^/stocks/([^/]+)/financials/balance-sheet/$"), "balance_sheet"),
+    (re.compile(r"^/stocks/([^/]+)/financials/$"), "financials"),
+    (re.compile(r"^/stocks/([^/]+)/$"), "overview"),
+]
+
+
+class StubSite:
+    def __init__(self, latency=0.0, jitter=0.0, burst_every=0.0, burst_length=0.0, retry_after=1,
+                 malformed_rate=0.0, seed=0):
+        self.latency = latency              # 每個回應固定延遲(秒)
+        self.jitter = jitter                # 額外的隨機延遲上限(秒)
+        self.burst_every = burst_every      # 每隔幾秒進入一次429爆量，0為不模擬
+        self.burst_length = burst_length    # 每次爆量持續幾秒
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.started = time.monotonic()
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.counts = {"200": 0, "404": 0, "429": 0}
+
+    def in_burst(self):
+        if not self.burst_every:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_length
+
+    def page(self, page, code):
+        key = (page, code)
+        with self._lock:
+            if key not in self._pages:
+                rng = random.Random(f"{self.seed}:{code}:{page}")
+                malformed = rng.random() < self.malformed_rate
+                self._pages[key] = PAGES[page](code, seed=rng.randrange(1 << 16), malformed=malformed).encode("utf-8")
+            return self._pages[key]
+
+    def count(self, status):
+        with self._lock:
+            self.counts[status] += 1
+
+
+def _make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            site.count(str(status))
+
+        def do_GET(self):
+            delay = site.latency + random.random() * site.jitter
+            if delay:
+                time.sleep(delay)
+            if site.in_burst():
+                return self._send(429, headers={"Retry-After": str(site.retry_after)})
+            for pattern, page in _ROUTES:
+                match = pattern.match(self.path)
+                if match:
+                    body = site.page(page, match.group(1).upper())
+                    return self._send(200, body, {"Content-Type": "text/html; charset=utf-8"})
+            return self._send(404)
+
+    return Handler
+
+
+def start_server(site, host="127.0.0.1", port=0):
+    #在背景執行緒啟動伺服器，port為0時由系統挑一個可用的port，回傳server(server.server_address取得實際位置)
+    server = ThreadingHTTPServer((host, port), _make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_site_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="每個回應的延遲(毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="額外的隨機延遲上限(毫秒)")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="每隔幾秒出現一次429爆量，0為不模擬")
+    parser.add_argument("--burst-length", type=float, default=1.0, help="每次429爆量持續幾秒")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--malformed", type=float, default=0.0, help="表格壞掉的頁面比例(0~1)")
+
+
+def site_from_args(args):
+    return StubSite(latency=args.latency / 1000, jitter=args.jitter / 1000, burst_every=args.burst_every,
+                    burst_length=args.burst_length, retry_after=args.retry_after, malformed_rate=args.malformed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local stockanalysis.com stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _make_handler(site_from_args(args)))
+    print(f"serving on http://127.0.0.1:{args.port}  (USSTOCKSYNC_SITE_URL=http://127.0.0.1:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+from config import EXCEL_PATH, MAX_CRAWL_WORKERS, PARSE_WORKERS, FRESHNESS_TTL
+from crawler import crawl_codes, collect_results, unique_codes, schedule_all_groups
+from http_session import close_sessions
+from http_cache import get_cache, set_cache_bypass, set_cache_revalidate
+from snapshot_store import get_snapshot_store
+from group import load_group_data
+from data_fetcher import write_to_excel
+from sync import smart_write_to_google_sheet
+from run_metrics import get_metrics
+from analytics import compute_derived
+from column_schema import ColumnSchema
+
+#不需要GUI的批次爬蟲入口，給沒有桌面環境的主機或排程(cron、工作排程器)使用，整個流程不會載入tkinter
+#用法：
+#   python cli.py --group "Default Group"
+#   python cli.py --tickers-file watchlist.txt --sink excel --sink sheets --spreadsheet-id <id>
+#   python cli.py --tickers AAPL MSFT --sink none --log-format json
+#   python cli.py --all-groups
+#   python cli.py --all-groups --export-only        (不爬蟲，只由歷史資料庫重建EXCEL/google sheet)
+#結束代碼：0 全部成功、1 部分股票失敗、2 參數錯誤、3 全部失敗或寫入失敗
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+
+SINKS = ["excel", "sheets", "none"]
+
+log = logging.getLogger("usstocksync")
+
+
+class JsonFormatter(logging.Formatter):
+    #每行一筆JSON，方便排程的log被其他工具收集
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    #一般文字格式，emit()帶的欄位以key=value接在訊息後面(cron的log也看得到成功/失敗數等資訊)
+    def __init__(self):
+        super().__init__("[%(asctime)s] %(levelname)s %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", {})
+        if fields:
+            line += " " + " ".join(f"{key}={_text_value(value)}" for key, value in fields.items())
+        return line
+
+
+def _text_value(value):
+    #含空白的字串加上引號，list以逗號分隔
+    if isinstance(value, (list, tuple)):
+        value = ",".join(str(v) for v in value)
+    value = str(value)
+    return json.dumps(value, ensure_ascii=False) if not value or any(ch.isspace() for ch in value) else value
+
+
+def setup_logging(log_format):
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+
+def emit(level, msg, **fields):
+    log.log(level, msg, extra={"fields": fields})
+
+
+def read_tickers_file(path):
+    #一行一個代碼，可用空白或逗號分隔，#開頭為註解
+    codes = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0]
+        codes.extend(part for part in line.replace(",", " ").split() if part)
+    return codes
+
+
+def resolve_codes(args):
+    if args.tickers:
+        codes = args.tickers
+    elif args.tickers_file:
+        codes = read_tickers_file(args.tickers_file)
+    elif args.all_groups:
+        #所有群組的聯集，每檔只爬一次，最久沒更新的優先
+        return schedule_all_groups(load_group_data())
+    else:
+        groups = load_group_data()
+        if args.group not in groups:
+            raise ValueError(f"找不到群組：{args.group}（現有群組：{', '.join(groups)}）")
+        codes = groups[args.group]
+    return unique_codes(codes)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="US StockSync headless crawl")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--group", help="爬取EXCEL Group分頁中的某個群組")
+    source.add_argument("--tickers-file", help="股票代碼清單檔")
+    source.add_argument("--tickers", nargs="+", help="直接指定股票代碼")
+    source.add_argument("--all-groups", action="store_true", help="爬取所有群組的代碼(重複的只爬一次)")
+    parser.add_argument("--workers", type=int, default=MAX_CRAWL_WORKERS, help="同時爬取的股票數量")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="解析HTML用的process數量，0為不使用process pool")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="忽略新鮮度設定，所有頁面都重新抓(HTTP快取也會先向網站確認)")
+    parser.add_argument("--no-cache", action="store_true", help="不使用HTTP快取")
+    parser.add_argument("--export-only", action="store_true",
+                        help="不爬蟲，由歷史資料庫輸出這些代碼最新的資料")
+    parser.add_argument("--sink", action="append", choices=SINKS,
+                        help="結果輸出位置，可重複指定；預設excel")
+    parser.add_argument("--excel-path", default=str(EXCEL_PATH))
+    parser.add_argument("--spreadsheet-id", help="輸出到google sheet時必填")
+    parser.add_argument("--force-close-excel", action="store_true", help="EXCEL檔被開啟時直接關閉")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text")
+    args = parser.parse_args(argv)
+    args.sink = args.sink or ["excel"]
+    if "none" in args.sink and len(set(args.sink)) > 1:
+        parser.error("--sink none 不能跟其他輸出位置一起指定")
+    if args.export_only and "none" in args.sink:
+        parser.error("--export-only 需要至少一個輸出位置")
+    if "sheets" in args.sink and not args.spreadsheet_id:
+        parser.error("--sink sheets 需要 --spreadsheet-id")
+    if args.workers < 1:
+        parser.error("--workers 至少為1")
+    if args.parse_workers < 0:
+        parser.error("--parse-workers 不可為負數")
+    return args
+
+
+def export(args, codes):
+    #由歷史資料庫輸出每檔最新資料到指定的位置，回傳是否全部成功
+    records = get_snapshot_store().latest(codes)
+    if not records:
+        emit(logging.ERROR, "歷史資料庫中沒有這些代碼的資料", tickers=len(codes))
+        return False
+    with get_metrics().timer("analytics"):
+        records += compute_derived(records)
+    schema = ColumnSchema(records)
+    rows = len(schema.tickers())
+    ok = True
+    if "excel" in args.sink:
+        try:
+            write_to_excel(records, file_path=args.excel_path, sheet_name="Crawl_data",
+                           interactive=False, force_close=args.force_close_excel, schema=schema)
+            emit(logging.INFO, "excel written", sink="excel", rows=rows, path=args.excel_path)
+        except Exception as e:
+            ok = False
+            emit(logging.ERROR, f"excel write failed: {e}", sink="excel")
+    if "sheets" in args.sink:
+        job = smart_write_to_google_sheet(
+            records,
+            spreadsheet_id=args.spreadsheet_id,
+            sheet_name="Crawl_data",
+            log_fn=lambda msg: emit(logging.INFO, msg, sink="sheets"),
+            schema=schema,
+        )
+        if job.result():
+            emit(logging.INFO, "sheets written", sink="sheets", rows=rows)
+        else:
+            ok = False
+            emit(logging.ERROR, "sheets write failed", sink="sheets")
+    return ok
+
+
+def report_metrics(total, success_count, mode="cli"):
+    #各階段耗時摘要寫到log，完整資料append到run_metrics.jsonl
+    metrics = get_metrics()
+    for line in metrics.summary_lines():
+        emit(logging.INFO, line.strip())
+    try:
+        metrics.export(mode=mode, tickers_total=total, succeeded=success_count)
+    except OSError as e:
+        emit(logging.WARNING, f"run metrics not written: {e}")
+
+
+def export_only(args, codes):
+    #不連網，直接由歷史資料庫重建輸出
+    get_metrics().reset()
+    emit(logging.INFO, "export started", tickers=len(codes), sinks=args.sink)
+    exported = export(args, codes)
+    report_metrics(len(codes), len(codes) if exported else 0, mode="cli-export")
+    return EXIT_OK if exported else EXIT_FAILED
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log_format)
+
+    try:
+        codes = resolve_codes(args)
+    except (OSError, ValueError) as e:
+        emit(logging.ERROR, str(e))
+        return EXIT_USAGE
+    if not codes:
+        emit(logging.ERROR, "沒有可爬取的股票代碼")
+        return EXIT_USAGE
+
+    if args.export_only:
+        return export_only(args, codes)
+
+    cache = get_cache()
+    set_cache_bypass(args.no_cache)
+    set_cache_revalidate(args.full_refresh)
+    cache.reset_stats()
+    get_metrics().reset()
+
+    total = len(codes)
+    started = time.perf_counter()
+    emit(logging.INFO, "crawl started", tickers=total, workers=args.workers,
+         parse_workers=args.parse_workers, cache=cache.enabled)
+
+    store = get_snapshot_store()
+    plan = None if args.full_refresh else store.pages_to_refresh(codes)
+    if plan is not None:
+        emit(logging.INFO, "refresh plan", pages=sum(len(p) for p in plan.values()),
+             pages_total=total * len(FRESHNESS_TTL))
+
+    def on_result(done_count, result):
+        if result.ok and not result.pages:
+            emit(logging.INFO, f"{result.code} fresh, skipped", ticker=result.code,
+                 status="fresh", done=done_count, total=total)
+        elif result.ok:
+            emit(logging.INFO, f"{result.code} | {result.name}", ticker=result.code,
+                 status="ok", pages=sorted(result.pages), done=done_count, total=total)
+        else:
+            emit(logging.WARNING, f"{result.code} failed: {result.error}", ticker=result.code,
+                 status="failed", done=done_count, total=total)
+
+    results = crawl_codes(codes, max_workers=args.workers, on_result=on_result,
+                          parse_workers=args.parse_workers, plan=plan)
+    records, fetched_pages = collect_results(results)
+    success_count = len(fetched_pages)
+
+    emit(logging.INFO, "crawl finished", succeeded=success_count, failed=total - success_count,
+         seconds=round(time.perf_counter() - started, 2), cache_hits=cache.hits,
+         cache_revalidated=cache.revalidated, cache_misses=cache.misses)
+
+    if not fetched_pages:
+        report_metrics(total, success_count)
+        return EXIT_FAILED
+
+    store.record_crawl(records, fetched_pages)
+    exported = True
+    if "none" not in args.sink:
+        exported = export(args, list(fetched_pages))
+
+    report_metrics(total, success_count)
+    if not exported:
+        return EXIT_FAILED
+    return EXIT_OK if success_count == total else EXIT_PARTIAL
+
+
+if __name__ == "__main__":
+    #打包成exe時，process pool的子process需要這行才不會重新執行main
+    multiprocessing.freeze_support()
+    try:
+        exit_code = main()
+    finally:
+        #HTTP連線池在整個程式執行期間共用，結束時才關閉
+        close_sessions()
+    sys.exit(exit_code)
@@ -0,0 +1,66 @@
+from metric_record import NAME_METRIC, OVERVIEW_METRICS, DERIVED_METRICS, COLUMN_PREFIX, statement_column, normalize_column
+
+#EXCEL與google sheet共用的欄位定義，每次輸出時由records建立一次
+#   columns：欄位順序，財報年度由資料產生(TTM、再由新到舊)，不再寫死年份
+#   cell(ticker, column)：每個儲存格只需一次dict查詢
+#   map_header(header)：把EXCEL既有的標題寫法(EPS (TTM)、EPS(2024)…)對應到欄位名稱
+
+TICKER_COLUMN = "股票代碼"
+TIMESTAMP_COLUMN = "更新時間"
+BASE_COLUMNS = [TICKER_COLUMN, NAME_METRIC, *OVERVIEW_METRICS, *DERIVED_METRICS]
+EMPTY_VALUES = {None, "", "NA", "N/A"}
+
+_BASE_INDEX = {column: idx for idx, column in enumerate(BASE_COLUMNS)}
+_PREFIX_INDEX = {prefix: idx for idx, prefix in enumerate(COLUMN_PREFIX.values())}
+
+
+def _sort_key(column):
+    #基本欄位 → 財報欄位(依項目、年度由新到舊) → 更新時間 → 其他欄位(維持原順序)
+    if column in _BASE_INDEX:
+        return 0, _BASE_INDEX[column], 0
+    if column == TIMESTAMP_COLUMN:
+        return 2, 0, 0
+    prefix, _, label = column.partition("(")
+    label = label.rstrip(")")
+    if prefix in _PREFIX_INDEX and (label == "TTM" or label.isdigit()):
+        return 1, _PREFIX_INDEX[prefix], -(9999 if label == "TTM" else int(label))
+    return 3, 0, 0
+
+
+class ColumnSchema:
+    def __init__(self, records):
+        #{ticker: {column: 顯示文字}}，依ticker第一次出現的順序
+        self.rows = {}
+        for record in records:
+            self.rows.setdefault(record.ticker, {})[record.column] = record.text
+        years = sorted({r.year for r in records if r.is_statement and r.year != -1}, reverse=True)
+        self.columns = BASE_COLUMNS + [
+            statement_column(prefix, year) for prefix in COLUMN_PREFIX.values() for year in years
+        ] + [TIMESTAMP_COLUMN]
+
+    def tickers(self):
+        return list(self.rows)
+
+    def cell(self, ticker, column):
+        #沒有資料或網站顯示為空的值一律寫"-"
+        value = self.rows.get(ticker, {}).get(column)
+        return "-" if value in EMPTY_VALUES else value
+
+    def order(self, existing=()):
+        #這次的欄位加上既有標題中的欄位，依固定規則排序(既有的年度欄位不會因為這次沒抓到而消失)
+        columns = list(self.columns)
+        known = set(columns)
+        for name in existing:
+            if name and name not in known:
+                columns.append(name)
+                known.add(name)
+        return sorted(columns, key=_sort_key)
+
+    def map_header(self, header):
+        #{標題文字: 欄號} → {欄位名稱: 欄號}，無法對應的標題略過
+        mapped = {}
+        for name, col in header.items():
+            column = name if name in _BASE_INDEX or name == TIMESTAMP_COLUMN else normalize_column(name)
+            if column:
+                mapped.setdefault(column, col)
+        return mapped
@@ -1,7 +1,89 @@
 from pathlib import Path
 import os
 
-APPDATA = Path(os.getenv("APPDATA")) / "USStockSync"
+#Windows使用%APPDATA%，其他系統(例如跑排程的Linux主機)沒有這個環境變數時改用~/.config
+APPDATA = Path(os.getenv("APPDATA") or Path.home() / ".config") / "USStockSync"
 EXCEL_PATH = APPDATA / "爬蟲更新區.xlsm"
 CREDENTIALS_PATH = APPDATA / "credentials.json"
-BASE = Path(__file__).parent
\ No newline at end of file
+BASE = Path(__file__).parent
+
+#爬取的網站，離線benchmark會用環境變數指到本機的假伺服器
+SITE_URL = os.getenv("USSTOCKSYNC_SITE_URL", "https://stockanalysis.com").rstrip("/")
+
+#併發爬蟲設定：同時處理的股票數量，以及對同一個網站最多同時發出的request數量
+MAX_CRAWL_WORKERS = 8
+MAX_REQUESTS_PER_HOST = 4
+
+#HTTP連線池設定：每個執行緒的session最多保留幾個host的連線池，以及每個host保留幾條keep-alive連線
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = MAX_REQUESTS_PER_HOST
+
+#HTTP回應快取設定：快取檔位置、容量上限，以及依URL規則設定的有效秒數(由上往下比對，第一個符合的規則生效)
+HTTP_CACHE_ENABLED = True
+HTTP_CACHE_PATH = APPDATA / "http_cache.sqlite"
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+HTTP_CACHE_TTL = [
+    (r"/financials/", 24 * 60 * 60),    # financials、balance sheet一天內不重抓
+    (r".*", 10 * 60),                   # 其他頁面(overview)十分鐘
+]
+#404也記在快取裡，在這段時間內不再重送同一個不存在的URL(例如沒有__data.json的頁面)
+HTTP_CACHE_NOT_FOUND_TTL = 60 * 60
+
+#全域自適應限速(AIMD)：每秒request數從INITIAL開始，回應正常時每次加INCREASE，遇到429時乘上DECREASE
+RATE_LIMIT_INITIAL = 2.0
+RATE_LIMIT_MIN = 0.2
+RATE_LIMIT_MAX = 8.0
+RATE_LIMIT_INCREASE = 0.05
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_BURST = 4
+
+#HTML解析後端："auto"依序嘗試selectolax、lxml、bs4，也可以指定其中一個
+HTML_PARSER_BACKEND = "auto"
+
+#優先使用頁面內嵌的JSON資料(__data.json)，缺少資料時才解析HTML
+USE_EMBEDDED_JSON = True
+#同一網站連續幾次拿不到__data.json就暫停嘗試，暫停幾秒後再試，避免每一頁都多送一個失敗的request
+JSON_MISS_LIMIT = 3
+JSON_MISS_BACKOFF = 60 * 60
+
+#解析HTML用的process數量，0為不使用process pool(在爬蟲執行緒中直接解析)
+#頁面多、CPU核心多時可設為核心數，解析就不會被GIL卡在單一核心
+PARSE_WORKERS = 0
+
+#群組資料在最後一次修改後等待幾秒才寫回EXCEL，連續新增/刪除代碼只會存一次檔
+GROUP_SAVE_DELAY = 2.0
+
+#每次爬蟲結果的歷史資料庫(EXCEL與google sheet都由這裡輸出)
+SNAPSHOT_DB_PATH = APPDATA / "snapshots.sqlite"
+
+#每一類頁面資料在多久之內(秒)視為新鮮，一般更新時只重新抓過期的頁面，0為每次都抓
+#年度EPS、Free Cash Flow、Total Debt最多一季才變一次，不需要跟每天變動的overview一起抓
+#「完整更新」會忽略這個設定，全部重新抓取
+FRESHNESS_TTL = {
+    "overview": 0,
+    "financials": 7 * 24 * 60 * 60,
+    "balance_sheet": 7 * 24 * 60 * 60,
+}
+
+#每次更新的各階段耗時與計數，一次一行JSON，用來追蹤是否變慢
+RUN_METRICS_PATH = APPDATA / "run_metrics.jsonl"
+
+#GUI每隔幾毫秒把背景執行緒送來的log與進度一次更新到畫面，每次最多處理幾筆
+UI_REFRESH_MS = 50
+UI_MAX_EVENTS_PER_FRAME = 2000
+
+#GUI log區域最多保留的行數，更早的只留在log檔(超過大小自動輪替，保留幾份備份)
+LOG_VIEW_MAX_LINES = 2000
+LOG_FILE_PATH = APPDATA / "logs" / "usstocksync.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+#google sheet內容的本地快照，用來只寫入有變動的儲存格；超過時間就重新讀取整頁，以免漏掉手動修改
+SHEET_SNAPSHOT_DIR = APPDATA / "sheet_snapshots"
+SHEET_SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+#google sheet的寫入都交給同一個執行緒池，最多同時幾個工作
+#預設1：同一分頁的寫入依序執行，本地快照算出的列號才不會被另一個寫入打亂
+SHEETS_MAX_WORKERS = 1
+#存取權杖剩下不到這個秒數就先更新，避免寫到一半過期
+SHEETS_TOKEN_REFRESH_MARGIN = 5 * 60
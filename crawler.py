@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from config import MAX_CRAWL_WORKERS, PARSE_WORKERS
+from data_fetcher import fetch_stock_data
+from metric_record import NAME_METRIC
+from snapshot_store import get_snapshot_store
+
+#併發爬蟲引擎：同時爬取多檔股票，同一網站的併發上限由data_fetcher的host名額控制
+#結果一律依照codes原本的順序回傳，讓後面寫入excel/google sheet的順序跟逐筆爬取時一樣
+
+class CrawlResult:
+    def __init__(self, code, records=None, error=None, pages=None):
+        self.code = code
+        self.records = records or []    # MetricRecord陣列
+        self.error = error
+        self.pages = pages or set()     # 這次實際抓到資料的頁面
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def name(self):
+        #公司名稱，這次沒抓overview時為"-"
+        return next((r.text for r in self.records if r.metric == NAME_METRIC), "-")
+
+
+def _crawl_one(code, pages=None, parse_pool=None):
+    try:
+        records, fetched = fetch_stock_data(code, pages, parse_pool)
+        return CrawlResult(code, records=records, pages=fetched)
+    except Exception as e:
+        return CrawlResult(code, error=e)
+
+
+def crawl_codes(codes, max_workers=MAX_CRAWL_WORKERS, on_result=None, parse_workers=PARSE_WORKERS, plan=None):
+    """
+    併發爬取codes中的每一檔股票，回傳依codes順序排列的CrawlResult陣列
+    on_result(done_count, result) 於每完成一檔時在呼叫端的執行緒被呼叫，可用來更新進度條及log
+    parse_workers大於0時，HTML頁面交給這麼多個process解析
+    plan為 {大寫code: 要抓的頁面}(見SnapshotStore.pages_to_refresh)，None時每檔都抓全部頁面
+    """
+    results = [None] * len(codes)
+    if not codes:
+        return results
+
+    workers = max(1, min(max_workers, len(codes)))
+    #每次爬蟲自己的process pool，直接傳給每一檔的PageBundle，同時進行的兩次爬蟲不會用到對方的pool
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            #future對應回原本的位置，完成順序不固定但回填的位置固定
+            futures = {pool.submit(_crawl_one, code, plan.get(code.strip().upper(), set()) if plan is not None else None, parse_pool): idx
+                       for idx, code in enumerate(codes)}
+            for done_count, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(done_count, result)
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+    return results
+
+
+def unique_codes(codes):
+    #統一大寫並去除重複，保留原本順序
+    seen = set()
+    ordered = []
+    for code in codes:
+        code = code.strip().upper()
+        if code and code not in seen:
+            seen.add(code)
+            ordered.append(code)
+    return ordered
+
+
+def schedule_all_groups(groups, current_group=None, store=None):
+    """
+    「更新全部群組」的爬取順序：所有群組代碼的聯集，每檔只爬一次
+    current_group的代碼排最前面，其餘依最久沒更新的排前面(從沒抓過的最優先)
+    ThreadPoolExecutor依送出的順序執行，所以這個順序就是實際的爬取優先順序
+    """
+    store = store or get_snapshot_store()
+    first = unique_codes(groups.get(current_group, [])) if current_group else []
+    rest = unique_codes(code for name, codes in groups.items() if name != current_group for code in codes)
+    first_set = set(first)
+    rest = [code for code in rest if code not in first_set]
+    last = store.last_refreshed(first + rest)
+
+    def stalest_first(codes):
+        #None(從沒抓過)排最前面，sorted是穩定排序，時間相同時維持群組中的順序
+        return sorted(codes, key=lambda code: last[code] or "")
+
+    return stalest_first(first) + stalest_first(rest)
+
+
+def collect_results(results):
+    #將成功的CrawlResult整理成 (全部的MetricRecord, {ticker: 實際抓到的頁面})，ticker依codes順序
+    records = []
+    fetched_pages = {}
+    for result in results:
+        if result is None or not result.ok:
+            continue
+        records.extend(result.records)
+        fetched_pages[result.code.strip().upper()] = result.pages
+    return records, fetched_pages
@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import openpyxl
 import psutil
 import os
@@ -8,8 +6,19 @@ import random
 import datetime
 import ctypes          # 用於關閉視窗
 import subprocess
-import tkinter.messagebox as messagebox
-from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA
+import threading
+from urllib.parse import urlparse
+from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA, MAX_REQUESTS_PER_HOST, USE_EMBEDDED_JSON, SITE_URL, \
+    JSON_MISS_LIMIT, JSON_MISS_BACKOFF
+from http_session import get_session
+from page_parser import ParsedPage, get_backend
+from metric_record import DERIVED_METRICS, build_records
+from column_schema import ColumnSchema, TICKER_COLUMN, TIMESTAMP_COLUMN
+from page_data import DATA_SUFFIX, load_nodes, extract_json_overview, extract_json_table, table_complete
+from http_cache import get_cache
+from excel_lock import workbook_lock
+from rate_limiter import get_limiter, parse_retry_after, backoff_delay
+from run_metrics import get_metrics
 
 #建立一個陣列，簡列一些使用者瀏覽資訊，方便未來可以random讀取
 USER_AGENTS = [
@@ -39,6 +48,17 @@ LANGUAGES = [
     "ko-KR,ko;q=0.9",
 ]
 
+#每個網站(host)一個Semaphore，限制併發爬蟲時同一網站同時進行中的request數量
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def _get_host_slot(url):
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        return _host_slots[host]
+
 #嘗試存取指定檔案，open(,"a")可以在沒有檔案情況下自動建立檔案
 def is_file_locked(EXCEL_PATH):
     if not os.path.exists(EXCEL_PATH):
@@ -63,62 +83,192 @@ def close_excel_instances(filename):
             pass
     return closed
 
-#爬蟲母體之一，於Overview頁面(即該股票首頁)抓取Shares Out, PE Ratio, Price Target
-#一開始先將這三個值設定為 - ，待後續抓到值後覆蓋 - 為正確資料
+#各頁面相對於股票首頁的路徑
+PAGE_PATHS = {
+    "overview": "",
+    "financials": "financials/",
+    "balance_sheet": "financials/balance-sheet/",
+}
+
+#HTML頁面要抓的列名稱
+PAGE_LABELS = {
+    "financials": ["EPS (Basic)", "Free Cash Flow", "Total Debt"],
+    "balance_sheet": ["Total Debt"],
+}
+#JSON一定要有的項目，缺任何一個(或缺某一年)就用HTML補；financials的Total Debt以balance sheet為準，不強制
+PAGE_REQUIRED_LABELS = {
+    "financials": ["EPS (Basic)", "Free Cash Flow"],
+    "balance_sheet": ["Total Debt"],
+}
+
+#各網站__data.json的失敗紀錄：host → (連續失敗次數, 暫停到的時間)
+#連續失敗JSON_MISS_LIMIT次後，JSON_MISS_BACKOFF秒內直接走HTML，時間到再試一次，成功就清掉紀錄
+_json_misses = {}
+_json_misses_lock = threading.Lock()
+
+def _json_available(host):
+    with _json_misses_lock:
+        count, until = _json_misses.get(host, (0, 0))
+        return count < JSON_MISS_LIMIT or time.time() >= until
+
+def _record_json_result(host, ok):
+    with _json_misses_lock:
+        if ok:
+            _json_misses.pop(host, None)
+        else:
+            count = _json_misses.get(host, (0, 0))[0] + 1
+            _json_misses[host] = (count, time.time() + JSON_MISS_BACKOFF)
+
+#同一檔股票在一次爬蟲中會用到的頁面組合，每個URL只下載一次、只解析一次
+#標題、Shares Out、PE Ratio、Price Target都從同一份overview文件取得，不再重複下載首頁
+#parse_pool為解析HTML用的process pool(由crawler建立並傳入)，None時在目前的執行緒解析
+class PageBundle:
+    def __init__(self, code, max_retries=5, parse_pool=None):
+        self.code = code
+        self.max_retries = max_retries
+        self.parse_pool = parse_pool
+        self._pages = {}
+        self._data = {}
+        self._extracted = {}
+        #extracted()會在持有lock時呼叫page()，所以用可重入的RLock
+        self._lock = threading.RLock()
+
+    def url(self, page):
+        return f"{SITE_URL}/stocks/{self.code}/{PAGE_PATHS[page]}"
+
+    def page(self, page):
+        #同一個bundle可能被多個執行緒共用，用lock確保同一頁不會被重複下載
+        with self._lock:
+            if page not in self._pages:
+                resp = safe_request(self.url(page), max_retries=self.max_retries)
+                with get_metrics().timer("parse_html"):
+                    self._pages[page] = ParsedPage(resp.text)
+            return self._pages[page]
+
+    def data(self, page):
+        #該頁面內嵌的JSON資料(SvelteKit的__data.json)，比整頁HTML小很多也不用建DOM
+        #關閉USE_EMBEDDED_JSON、這個網站最近一直拿不到JSON，或抓取/解析失敗時回傳None，由呼叫端改用HTML
+        if not USE_EMBEDDED_JSON:
+            return None
+        host = urlparse(SITE_URL).netloc
+        with self._lock:
+            if page not in self._data:
+                nodes = None
+                if _json_available(host):
+                    try:
+                        resp = safe_request(self.url(page) + DATA_SUFFIX, max_retries=self.max_retries)
+                        with get_metrics().timer("parse_json"):
+                            nodes = load_nodes(resp.text) or None
+                    except Exception:
+                        nodes = None
+                    _record_json_result(host, nodes is not None)
+                self._data[page] = nodes
+            return self._data[page]
+
+    def extracted(self, page):
+        #從HTML頁面抽出的結果(見extract_page)
+        #有設定process pool時，只把原始HTML送到其他process解析，拿回小小的dict，讓解析不受GIL限制
+        with self._lock:
+            if page not in self._extracted:
+                pool = self.parse_pool
+                if pool is None:
+                    parsed = self.page(page)
+                    with get_metrics().timer("extract"):
+                        self._extracted[page] = extract_parsed(page, parsed, self.code)
+                else:
+                    resp = safe_request(self.url(page), max_retries=self.max_retries)
+                    #process pool的等待時間也算在解析裡
+                    with get_metrics().timer("parse_html"):
+                        self._extracted[page] = pool.submit(extract_page, page, resp.text, self.code).result()
+            return self._extracted[page]
+
+
+#從overview文件抓標題(這邊會抓到公司名稱)
+def extract_title(page, code):
+    title = page.title() or "Unknown resolution"
+    return title.replace(f" ({code}) Stock Price & Overview", "").strip()
+
+#從overview文件抓Shares Out, PE Ratio, Price Target, Market Cap，一開始先將這四個值設定為 - ，待後續抓到值後覆蓋 - 為正確資料
+def extract_overview_metrics(page):
+    shares_out = pe_ratio = price_target = market_cap = "-"
+    #目標資料被藏在<td>底下，每個<td>的文字只取一次
+    tds = page.cell_texts()
+    #要抓得值在被find的值+1的td中，透過zip把每個td跟下一個td配對，避免溢位
+    for lbl, val in zip(tds, tds[1:]):
+        if lbl.startswith("Shares Out"):
+            shares_out = val
+        elif lbl.startswith("PE Ratio"):
+            pe_ratio = val
+        elif lbl.startswith("Price Target"):
+            price_target = val
+        elif lbl.startswith("Market Cap"):
+            market_cap = val
+    return shares_out, pe_ratio, price_target, market_cap
+
+#因為這邊同一項目因年份關係，有六欄值，加上還要確認抓取到的年份，改用table而非td標籤，且只走訪第一個table
+def extract_table_rows(page, labels):
+    data = {}
+    table = page.first_table()
+    if not table:
+        return data
+    headers, rows = table
+    #年份在th標籤裡面，從[1]開始抓是因為[0]為其他字串，非年分
+    years = headers[1:]
+    for cols in rows:
+        lbl = cols[0] if cols else ""
+        if lbl not in labels:
+            continue
+        #透過zip將年分與抓到的數值綁定(cols[0]為標籤名稱，非數值)，並個別存到yr、val的變數中，遇到val的值為Upgrade用continue略過
+        for yr, val in zip(years, cols[1:]):
+            if val == "Upgrade":
+                continue
+            #接著再接抓到的val數值對應進data字典中的同年份、同分類標籤底下
+            data[f"{lbl} ({yr})"] = val
+    return data
+
+
+#對已解析的頁面抽出爬蟲需要的資料
+#overview回傳 {"title": 公司名稱, "metrics": (shares_out, pe_ratio, price_target, market_cap)}，其他頁面回傳 {"rows": {...}}
+def extract_parsed(page, parsed, code):
+    if page == "overview":
+        return {"title": extract_title(parsed, code), "metrics": extract_overview_metrics(parsed)}
+    return {"rows": extract_table_rows(parsed, PAGE_LABELS[page])}
 
-def fetch_overview_metrics(code, max_retries=5):
-    url = f"https://stockanalysis.com/stocks/{code}/"
-    shares_out = pe_ratio = price_target = "-"
+#給process pool呼叫的版本：傳入原始HTML，在子process中解析
+def extract_page(page, html, code, backend=None):
+    return extract_parsed(page, ParsedPage(html, get_backend(backend) if backend else None), code)
+
+
+#爬蟲母體之一，於Overview頁面(即該股票首頁)抓取Shares Out, PE Ratio, Price Target, Market Cap
+#有傳入bundle時直接使用已下載的overview文件，優先使用內嵌JSON，四個值沒有全部找到才解析HTML
+def fetch_overview_metrics(code, max_retries=5, bundle=None):
+    shares_out = pe_ratio = price_target = market_cap = "-"
     try:
         #發送request，並於失敗後自動重新發送，直到次數達到最大設定次數
-        resp = safe_request(url, max_retries=max_retries)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        #目標資料被藏在<td>底下
-        tds = soup.find_all("td")
-        #迴圈每個<td>，透過len取得最大td數量，因為我們要抓得值在被find的值+1的td中，所以在for迴圈時只能迴圈到len(tds)-1，避免溢位
-        #而range則是從i = 0 to i = len(tds)-1
-        #透過strip將頭尾空格去掉，再透過if比較關鍵字，符合條件後才存入對應變數
-        for i in range(len(tds) - 1):
-            lbl = tds[i].get_text(strip=True)
-            val = tds[i+1].get_text(strip=True)
-            if lbl.startswith("Shares Out"):
-                shares_out = val
-            elif lbl.startswith("PE Ratio"):
-                pe_ratio = val
-            elif lbl.startswith("Price Target"):
-                price_target = val
+        bundle = bundle or PageBundle(code, max_retries=max_retries)
+        nodes = bundle.data("overview")
+        if nodes:
+            _, *values = extract_json_overview(nodes)
+            if None not in values:
+                return (code, *values)
+        shares_out, pe_ratio, price_target, market_cap = bundle.extracted("overview")["metrics"]
     except Exception as e:
         #回傳錯誤代碼
         print(f"❌ fetch_overview_metrics({code}) 錯誤：{e}")
-    return code, shares_out, pe_ratio, price_target
+    return code, shares_out, pe_ratio, price_target, market_cap
 
 
 
 #爬蟲母體之一，於financials抓取EPS (Basic)、Free Cash Flow、Total Debt三種類別的資料
-#因為這邊同一項目因年份關係，有六欄值，加上還要確認抓取到的年份，改用table而非td標籤
-def fetch_financial_metrics(code, max_retries=5):
-    url = f"https://stockanalysis.com/stocks/{code}/financials/"
+def fetch_financial_metrics(code, max_retries=5, bundle=None):
     data = {}
     try:
-        resp = safe_request(url, max_retries=max_retries)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        table = soup.find("table")
-        if not table:
-            return data
-        #年份在th標籤裡面
-        years = [th.get_text(strip=True) for th in table.thead.find_all("th")][1:]
-        #各項目在tbody的tr標籤中的td標籤裡面，透過迴圈搜尋tr標籤中的td標籤，並存入cols陣列中，
-        for tr in table.tbody.find_all("tr"):
-            cols = [td.get_text(strip=True) for td in tr.find_all("td")]
-            lbl = cols[0] if cols else ""
-            if lbl not in ["EPS (Basic)", "Free Cash Flow", "Total Debt"]:
-                continue
-                #透過zip將年分與抓到的數值綁定(cols[0]為標籤名稱，非數值)，並個別存到yr、val的變數中，遇到val的值為Upgrade用continue略過
-            for yr, val in zip(years, cols[1:]):
-                if val == "Upgrade":
-                    continue
-                #接著再接抓到的val數值對應進data字典中的同年份、同分類標籤底下，之後可以考慮data[{lbl}][{yr}]可能更好用
-                data[f"{lbl} ({yr})"] = val
+        bundle = bundle or PageBundle(code, max_retries=max_retries)
+        nodes = bundle.data("financials")
+        data = extract_json_table(nodes, PAGE_LABELS["financials"]) if nodes else {}
+        if not table_complete(data, PAGE_REQUIRED_LABELS["financials"]):
+            #JSON缺少某個項目或某個年度時用HTML補上，兩邊都有的以JSON為準
+            data = {**bundle.extracted("financials")["rows"], **data}
     except Exception as e:
         print(f"❌ fetch_financial_metrics({code}) 錯誤：{e}")
     return data
@@ -126,38 +276,65 @@ def fetch_financial_metrics(code, max_retries=5):
 
 
 
-def fetch_total_debt(code, max_retries=5):
+def fetch_total_debt(code, max_retries=5, bundle=None):
     """
     專門抓 Balance Sheet 裡的 Total Debt
     回傳 {"Total Debt (TTM)": "...", ...}
     """
-    url = f"https://stockanalysis.com/stocks/{code}/financials/balance-sheet/"
     data = {}
     try:
-        resp = safe_request(url, max_retries=max_retries)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        #要抓六個年份，不適用單抓td
-        table = soup.find("table")
-        if not table:
-            return data
-        #從table中的th標籤抓年分 從[1]開始抓是因為[0]為其他字串，非年分
-        years = [th.get_text(strip=True) for th in table.thead.find_all("th")][1:]
-        #在tbody中迴圈每個tr標籤，並抓tr標籤中的td標籤存入cols陣列中
-        for tr in table.tbody.find_all("tr"):
-            cols = [td.get_text(strip=True) for td in tr.find_all("td")]
-            #從cols陣列再去抓出標的關鍵字Total Debt
-            if cols and cols[0] == "Total Debt":
-                #綁定標的字串與數值並排除Upgrade地當次迴圈
-                for yr, val in zip(years, cols[1:]):
-                    if val == "Upgrade":
-                        continue
-                    #if true時代表資料正確，綁入data陣列中的{yr}變數下
-                    data[f"Total Debt ({yr})"] = val
-                break
+        bundle = bundle or PageBundle(code, max_retries=max_retries)
+        nodes = bundle.data("balance_sheet")
+        data = extract_json_table(nodes, PAGE_LABELS["balance_sheet"]) if nodes else {}
+        if not table_complete(data, PAGE_REQUIRED_LABELS["balance_sheet"]):
+            data = {**bundle.extracted("balance_sheet")["rows"], **data}
     except Exception as e:
         print(f"❌ fetch_total_debt({code}) 錯誤：{e}")
     return data
 
+#單一股票的爬取流程(標題 + Overview + Financials + Balance Sheet)，供併發爬蟲的worker呼叫
+#pages為這次要抓的頁面(預設全部)，沒抓的頁面不會產生record
+#回傳 MetricRecord陣列(數值已解析成float)，以及實際抓到資料的頁面
+#首頁抓取失敗時直接raise讓呼叫端記錄
+def fetch_stock_data(code, pages=None, parse_pool=None):
+    with get_metrics().ticker_scope(code.strip().upper()):
+        return _fetch_stock_data(code, pages, parse_pool)
+
+def _fetch_stock_data(code, pages, parse_pool):
+    pages = set(PAGE_PATHS) if pages is None else set(pages)
+    bundle = PageBundle(code, parse_pool=parse_pool)
+    fetched = set()
+    extra = {}
+    row = (code, None, None, None, None)
+    if "overview" in pages:
+        #公司名稱優先從內嵌JSON取得，沒有時才下載首頁HTML，首頁只下載一次，標題與Overview的三個值共用同一份文件
+        nodes = bundle.data("overview")
+        title = extract_json_overview(nodes)[0] if nodes else None
+        if not title:
+            title = bundle.extracted("overview")["title"]
+        row = fetch_overview_metrics(code, bundle=bundle)
+        extra["公司名稱"] = title
+        fetched.add("overview")
+
+    #資料擷取完成後的各變數(每頁只送一次request，JSON缺資料時才補抓HTML)
+    financials = {}
+    if "financials" in pages:
+        financials = fetch_financial_metrics(code, bundle=bundle)
+        if financials:
+            fetched.add("financials")
+        if "balance_sheet" not in pages:
+            #Total Debt以balance sheet為準，這次沒抓balance sheet時不用financials頁面的值蓋掉
+            financials = {key: value for key, value in financials.items()
+                          if not key.startswith(tuple(PAGE_LABELS["balance_sheet"]))}
+    if "balance_sheet" in pages:
+        td_data = fetch_total_debt(code, bundle=bundle)
+        if td_data:
+            fetched.add("balance_sheet")
+        financials.update(td_data)
+
+    extra = {**financials, **extra}
+    return build_records(row, extra), fetched
+
 #先找到excel中名為"股票代碼"的column，並繼續在該column中搜尋最靠近上方空白列的row座標
 def get_next_available_row(ws, id_col_name="股票代碼", start_row=2):
     #找出股票代碼欄的column
@@ -178,134 +355,227 @@ def get_next_available_row(ws, id_col_name="股票代碼", start_row=2):
     return ws.max_row + 1
 
 
-def write_to_excel(data_rows, extra_data_dict=None, file_path=EXCEL_PATH, sheet_name="Crawl_data"):
-    #檢查檔案是否開啟，透過def is_file_locked回傳布林
-    auto_closed_excel = False
-    if is_file_locked(EXCEL_PATH):
-        user_choice = messagebox.askyesno(
-            "Excel 檔案已開啟",
-            f"{os.path.basename(EXCEL_PATH)} 檔案目前正在被 Excel 使用中。\n\n是否要強制關閉它來更新資料？（請確保檔案已儲存變更）"
-        )
-        if not user_choice:
-            messagebox.showinfo("程序中止", "請先關閉Excel檔案後再執行。")
-            return
-        else:
-            closed = close_excel_instances(os.path.basename(EXCEL_PATH))
-            if closed:
-                auto_closed_excel = True
-            else:
-                messagebox.showwarning("無法關閉", "系統無法自動關閉Excel，請手動關閉。")
-                return
-
-    #確保data_rows轉為陣列
-    if isinstance(data_rows, tuple):
-        data_rows = [data_rows]
-
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.create_sheet(sheet_name)
-
+#標題列：欄位名稱→column
+def build_header_index(ws):
     header = {}
     for cell in ws[1]:
         val = cell.value
         if isinstance(val, str):
             header[val] = cell.column
         elif cell.data_type == "f":  # 如果是公式
-            val = str(cell.value).strip()
             if cell.internal_value:
-                header[cell.internal_value.strip()] = cell.column
+                header[str(cell.internal_value).strip()] = cell.column
+    return header
+
+#掃描一次股票代碼欄，回傳 (代碼→列號, 由上而下的空白列)，空白列的規則跟get_next_available_row相同
+def build_row_index(ws, id_col, start_row=2):
+    row_index = {}
+    free_rows = []
+    for row, (val,) in enumerate(ws.iter_rows(min_row=start_row, max_row=ws.max_row,
+                                              min_col=id_col, max_col=id_col, values_only=True), start_row):
+        key = str(val or "").strip().upper()
+        if not key:
+            free_rows.append(row)
+        elif key not in row_index:
+            row_index[key] = row
+    return row_index, free_rows
+
+#EXCEL標題找不到這些欄位時使用的預設位置
+EXCEL_DEFAULT_COLUMNS = {
+    "股票代碼": 1,
+    "公司名稱": 2,
+    "SharesOut": 3,
+    "PE Ratio": 4,
+    "Price Target": 5,
+    "更新時間": 11,
+}
+#這些欄位在EXCEL標題中還沒有時，自動加在最後一欄之後
+EXCEL_APPEND_COLUMNS = ["Market Cap", *DERIVED_METRICS]
+
+#讀取活頁簿、寫入各股票的列、存檔，呼叫端需持有workbook_lock
+def _write_workbook(records, file_path, sheet_name, schema):
+    metrics = get_metrics()
+    with metrics.timer("excel_load"):
+        wb = openpyxl.load_workbook(file_path, keep_vba=True)
+    ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.create_sheet(sheet_name)
 
-    #先寫入第一頁爬到的資料
-    for code, shares, pe, price_target in data_rows:
+    write_started = time.perf_counter()
+    schema = schema or ColumnSchema(records)
+    #標題對應到欄位名稱只解析一次，找不到的基本欄位使用預設位置
+    columns = schema.map_header(build_header_index(ws))
+    for column, default in EXCEL_DEFAULT_COLUMNS.items():
+        columns.setdefault(column, default)
+    next_col = max([ws.max_column, *columns.values()]) + 1
+    for column in EXCEL_APPEND_COLUMNS:
+        if column not in columns:
+            ws.cell(row=1, column=next_col, value=column)
+            columns[column] = next_col
+            next_col += 1
+    id_col = columns.pop(TICKER_COLUMN)
+    timestamp_col = columns.pop(TIMESTAMP_COLUMN)
+    #股票代碼→列號、可用空白列都只掃描一次
+    row_index, free_rows = build_row_index(ws, id_col)
+    next_new_row = ws.max_row + 1
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    for code in schema.tickers():
         if not code:
             continue
 
-        # 找資料列
-        found_row = None
-        #如果strip的code與儲存格中相同，將該Row設為寫入目標
-        for row in range(2, ws.max_row + 1):
-            if str(ws.cell(row=row, column=header.get("股票代碼", 1)).value).strip().upper() == code.strip().upper():
-                found_row = row
-                break
-        #如果found_row有值則寫入row，如果沒有就取最靠近上方的空白列
-        row = found_row if found_row else get_next_available_row(ws)
-
-        # 主欄位寫入
-        ws.cell(row=row, column=header.get("股票代碼", 1), value=code)
-        ws.cell(row=row, column=header.get("SharesOut", 3), value=shares)
-        ws.cell(row=row, column=header.get("PE Ratio", 4), value=pe)
-        ws.cell(row=row, column=header.get("Price Target", 5), value=price_target)
-
-        #第二頁爬到的資料（EPS & FCF）
-        if extra_data_dict:
-            raw_data = extra_data_dict.get(code, {})
-            for col_name in header:
-                #遇到下列關鍵字則略過
-                if col_name in ["股票代碼", "SharesOut", "PE Ratio", "Price Target", "更新時間"]:
-                    continue
-
-                #EPS部分的處理 先找要搜尋網頁的關鍵字
-                if col_name.startswith("EPS"):
-                    #in(含)
-                    if "TTM" in col_name:
-                        lookup_key = "EPS (Basic) (TTM)"
-                    else:
-                        year = col_name[col_name.find("(")+1:col_name.find(")")]
-                        lookup_key = f"EPS (Basic) (FY {year})"
-
-                # Free Cash Flow
-                elif col_name.startswith("Free Cash Flow"):
-                    if "TTM" in col_name:
-                        lookup_key = "Free Cash Flow (TTM)"
-                    else:
-                        year = col_name[col_name.find("(")+1:col_name.find(")")]
-                        lookup_key = f"Free Cash Flow (FY {year})"
-
-                # Total Debt
-                elif col_name.startswith("Total Debt"):
-                    if "TTM" in col_name:
-                        lookup_key = "Total Debt (TTM)"
-                    else:
-                        year = col_name[col_name.find("(")+1:col_name.find(")")]
-                        lookup_key = f"Total Debt (FY {year})"
-
-                else:
-                    continue
+        #如果索引中有這個代碼就寫回原本的列，沒有就取最靠近上方的空白列
+        code_key = code.strip().upper()
+        row = row_index.get(code_key)
+        if row is None:
+            if free_rows:
+                row = free_rows.pop(0)
+            else:
+                row = next_new_row
+                next_new_row += 1
+            row_index[code_key] = row
 
-                val = raw_data.get(lookup_key, "-")
-                #這行先寫入公司名稱(從main回傳過來的)
-                ws.cell(row=row, column=header.get("公司名稱", 2), value=raw_data.get("公司名稱", "-"))
-                #這行則是寫入各類別資料到本地EXCEL中
-                ws.cell(row=row, column=header[col_name], value=val)
+        #股票代碼、公司名稱、Overview、衍生指標與各類別財報資料（EPS & FCF & Total Debt）
+        ws.cell(row=row, column=id_col, value=code)
+        for column, col in columns.items():
+            ws.cell(row=row, column=col, value=schema.cell(code, column))
 
         # 寫入資料更新時間
-        timestamp_col = header.get("更新時間", 11)  # 若找不到就 fallback 用第11欄
-        ws.cell(row=row, column=timestamp_col, value=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        ws.cell(row=row, column=timestamp_col, value=timestamp)
+
+    metrics.add_time("excel_write", time.perf_counter() - write_started)
+    with metrics.timer("excel_save"):
+        wb.save(file_path)
+
+#開啟中的EXCEL：GUI模式詢問使用者是否強制關閉；headless模式(interactive=False)不跳視窗，
+#force_close為True時直接關閉，否則raise PermissionError讓呼叫端處理
+#interactive=True會呼叫messagebox，只能在Tk主執行緒使用；背景執行緒請先在主執行緒問好再傳force_close
+#reopen為True時，強制關閉的EXCEL在寫入後重新打開(interactive模式一律會重新打開)
+#records為MetricRecord陣列，同一檔股票的records寫到同一列
+#schema為column_schema.ColumnSchema，輸出到多個地方時由呼叫端建立一次共用，沒傳時由records建立
+def write_to_excel(records, file_path=EXCEL_PATH, sheet_name="Crawl_data", interactive=True, force_close=False, schema=None,
+                   reopen=False):
+    #檢查檔案是否開啟，透過def is_file_locked回傳布林
+    auto_closed_excel = False
+    if is_file_locked(file_path):
+        filename = os.path.basename(file_path)
+        if not interactive:
+            if not force_close:
+                raise PermissionError(f"{filename} 檔案目前正在被 Excel 使用中")
+            if not close_excel_instances(filename):
+                raise PermissionError(f"無法自動關閉 Excel：{filename}")
+            auto_closed_excel = reopen
+        else:
+            #只有GUI模式才載入tkinter，headless環境不需要
+            import tkinter.messagebox as messagebox
+            user_choice = messagebox.askyesno(
+                "Excel 檔案已開啟",
+                f"{filename} 檔案目前正在被 Excel 使用中。\n\n是否要強制關閉它來更新資料？（請確保檔案已儲存變更）"
+            )
+            if not user_choice:
+                messagebox.showinfo("程序中止", "請先關閉Excel檔案後再執行。")
+                return
+            else:
+                closed = close_excel_instances(filename)
+                if closed:
+                    auto_closed_excel = True
+                else:
+                    messagebox.showwarning("無法關閉", "系統無法自動關閉Excel，請手動關閉。")
+                    return
 
-    wb.save(EXCEL_PATH)
+    with workbook_lock:
+        _write_workbook(records, file_path, sheet_name, schema)
 
     if auto_closed_excel:
         try:
-            subprocess.Popen(["start", "", EXCEL_PATH], shell=True)
+            subprocess.Popen(["start", "", file_path], shell=True)
         except Exception as e:
             print(f"無法自動打開 Excel：{e}")
 
-#因為出現429代碼，所以先弄個def確認代碼429後執行重新連接，backoff單位是秒
-def safe_request(url, headers=None, max_retries=5, backoff=(3, 6)):
+#因為出現429代碼，所以先弄個def確認代碼429後執行重新連接
+#429的等待時間為指數退避：第n次等 min(backoff_cap, backoff_base × 2^(n-1)) 秒再乘上0.5~1的隨機值，有Retry-After時至少等那麼久
+#(舊版的backoff=(3, 6)是每次在3~6秒之間隨機等待，參數意義不同所以改名)
+#同一網站的request共用一個自適應限速器，遇到429時整個爬蟲一起降速，而不是只有這一個request重試
+def safe_request(url, headers=None, max_retries=5, backoff_base=3, backoff_cap=60, use_cache=True):
+    #先查快取：有效期限內直接回傳，過期則帶上ETag/Last-Modified讓伺服器判斷是否有更新
+    cache = get_cache() if use_cache else None
+    if cache and not cache.enabled:
+        cache = None
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(entry):
+        cache.count("hits")
+        resp = entry.to_response()
+        #記住的404跟實際送出request一樣raise
+        resp.raise_for_status()
+        return resp
+    if entry and entry.status != 200:
+        #過期的404重新送出，不帶驗證標頭
+        entry = None
+
+    metrics = get_metrics()
+    limiter = get_limiter(urlparse(url).netloc)
     for attempt in range(1, max_retries + 1):
-        #呼叫下方的隨機headers取得不相同的瀏覽組合
-        h = headers or get_random_headers()
-        resp = requests.get(url, headers=h, timeout=10)
+        if attempt > 1:
+            metrics.incr("retries")
+        #呼叫下方的隨機headers取得不相同的瀏覽組合，每次request都重新抽，連線則沿用同一個session的keep-alive連線池
+        h = dict(headers or get_random_headers())
+        if entry:
+            h.update(entry.validator_headers())
+        #取得該網站的名額後才送出，避免併發時同一網站被同時打太多request
+        with metrics.timer("wait_slot"):
+            slot = _get_host_slot(url)
+            slot.acquire()
+        try:
+            with metrics.timer("rate_limit"):
+                limiter.acquire()
+            with metrics.timer("network"):
+                resp = get_session().get(url, headers=h, timeout=10)
+        finally:
+            slot.release()
+        metrics.incr("requests")
+        metrics.incr("bytes_downloaded", _wire_bytes(resp))
         if resp.status_code == 429:
-            wait = random.uniform(*backoff)
-            print(f"⚠️ [{attempt}/{max_retries}] 429 Too Many Requests for {url}，等待 {wait:.1f}秒")
-            time.sleep(wait)
+            metrics.incr("http_429")
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            limiter.on_throttle(retry_after)
+            wait = backoff_delay(attempt, retry_after, backoff_base, backoff_cap)
+            print(f"⚠️ [{attempt}/{max_retries}] 429 Too Many Requests for {url}，等待 {wait:.1f}秒 (限速 {limiter.rate:.2f} req/s)")
+            with metrics.timer("backoff_429"):
+                time.sleep(wait)
             continue
+        if resp.status_code >= 500:
+            #伺服器錯誤多半是負載過高，跟429一樣降速(但不重試，直接raise)
+            limiter.on_throttle(parse_retry_after(resp.headers.get("Retry-After")))
+        elif resp.status_code < 300 or resp.status_code == 304:
+            #只有成功的回應才加速，404等其他錯誤維持目前速度
+            limiter.on_success()
+        #304代表內容沒變，沿用快取
+        if resp.status_code == 304 and entry:
+            cache.touch(url)
+            cache.count("revalidated")
+            return entry.to_response()
+        if resp.status_code == 404 and cache:
+            cache.store(url, resp)
         resp.raise_for_status()
+        if cache:
+            cache.count("misses")
+            cache.store(url, resp)
         return resp
     #最後一次仍錯誤，就直接 raise
     resp.raise_for_status()
 
 
+#實際在網路上傳輸的位元組數：resp.content是gzip/brotli解壓縮後的大小，會高估好幾倍
+#優先用Content-Length(壓縮後的長度)，沒有時用urllib3讀取的原始位元組數(chunked傳輸時取不到，為0)，都沒有才用內容長度
+def _wire_bytes(resp):
+    size = len(resp.content)
+    length = resp.headers.get("Content-Length", "")
+    if length.isdigit():
+        return int(length)
+    try:
+        raw = int(resp.raw.tell())
+    except (AttributeError, TypeError, ValueError):
+        raw = 0
+    return raw or size
+
 #這邊的陣列寫在最上方
 def get_random_headers():
     return {
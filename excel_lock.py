@@ -0,0 +1,6 @@
+import threading
+
+#EXCEL活頁簿每次都是整份讀進來(load_workbook)再整份存回去(save)
+#群組的背景存檔與爬蟲寫入Crawl_data若同時進行，後存檔的會蓋掉另一方的修改
+#所有對EXCEL_PATH的load → save流程都要持有這個lock
+workbook_lock = threading.RLock()
@@ -1,107 +1,153 @@
 import openpyxl
 import os
-from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA
+import atexit
+import threading
+import time
+from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA, GROUP_SAVE_DELAY
 from openpyxl.utils import get_column_letter
+from run_metrics import get_metrics
+from excel_lock import workbook_lock
 #宣告一下，怕等一下忘記
 SHEET_NAME = "Group"
 
-def ensure_group_sheet():
-    #如果EXCEL檔案不存在
-    if not os.path.exists(EXCEL_PATH):
+def _open_group_sheet():
+    #只開一次活頁簿，檔案或分頁不存在時在記憶體中建立，由呼叫端決定要不要存檔
+    if os.path.exists(EXCEL_PATH):
+        with get_metrics().timer("group_load"):
+            wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
+    else:
         wb = openpyxl.Workbook()
-        wb.save(EXCEL_PATH)
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
     #如果分頁不存在
     if SHEET_NAME not in wb.sheetnames:
         ws = wb.create_sheet(SHEET_NAME)
         ws.cell(row=1, column=1, value="序號")  # A欄作為標示保留
         ws.cell(row=1, column=2, value="Default Group")  # B欄為預設群組
-    wb.save(EXCEL_PATH)
-
-def save_group_data(groups_dict):
-    #將整個群組資料結構同步到Excel
-
-    ensure_group_sheet()
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[SHEET_NAME]
-
-    ws.delete_cols(2, ws.max_column)  # 清空舊資料（保留 A 欄）
-
-    col = 2
-    #從B欄開始迴圈到groups_dict結束，將字典中每個項目存到row1作為群組名稱
-    for group_name, stock_list in groups_dict.items():
-        ws.cell(row=1, column=col, value=group_name)
-        #從row2開始，迴圈stock_list，直到字典結束，此處為股票代碼
-        for idx, code in enumerate(stock_list, start=2):
-            ws.cell(row=idx, column=col, value=code)
-        col += 1
-    wb.save(EXCEL_PATH)
-
-def rename_group(old_name, new_name):
-    ensure_group_sheet()
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[SHEET_NAME]
-
-    for cell in ws[1]:
-        if cell.value == old_name:
-            cell.value = new_name
-            break
-    wb.save(EXCEL_PATH)
-
-def delete_group(group_name):
-    ensure_group_sheet()
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[SHEET_NAME]
+    return wb, wb[SHEET_NAME]
 
-    for col in range(2, ws.max_column + 1):
-        if ws.cell(row=1, column=col).value == group_name:
-            ws.delete_cols(col, 1)
-            break
-    wb.save(EXCEL_PATH)
-
-
-
-def update_single_group_column(group_name, stock_list):
-    #徹底清空EXCEL中指定群組欄的資料並重寫
-    ensure_group_sheet()
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[SHEET_NAME]
-
-    target_col = None
-    for col in range(2, ws.max_column + 1):
-        if ws.cell(row=1, column=col).value == group_name:
-            target_col = col
-            break
-
-    if target_col is None:
-        return
-
-    #如果該欄有值，透過""的方式將每個儲存格清空
-    for row in range(2, ws.max_row + 1):
-        ws.cell(row=row, column=target_col, value="")
-
-    #再寫入新的資料
-    for idx, code in enumerate(stock_list, start=2):
-        ws.cell(row=idx, column=target_col, value=code)
+def _save_group_workbook(wb):
+    with get_metrics().timer("group_save"):
+        wb.save(EXCEL_PATH)
 
-    wb.save(EXCEL_PATH)
+def save_group_data(groups_dict):
+    #將整個群組資料結構同步到Excel，讀取到存檔之間持有workbook_lock，不會跟爬蟲寫入Crawl_data互相覆蓋
+    with workbook_lock:
+        wb, ws = _open_group_sheet()
+
+        ws.delete_cols(2, ws.max_column)  # 清空舊資料（保留 A 欄）
+
+        col = 2
+        #從B欄開始迴圈到groups_dict結束，將字典中每個項目存到row1作為群組名稱
+        for group_name, stock_list in groups_dict.items():
+            ws.cell(row=1, column=col, value=group_name)
+            #從row2開始，迴圈stock_list，直到字典結束，此處為股票代碼
+            for idx, code in enumerate(stock_list, start=2):
+                ws.cell(row=idx, column=col, value=code)
+            col += 1
+        _save_group_workbook(wb)
 
 def load_group_data():
-    #從EXCEL載入所有群組與股票代碼
-    ensure_group_sheet()
-    wb = openpyxl.load_workbook(EXCEL_PATH, keep_vba=True)
-    ws = wb[SHEET_NAME]
+    #從EXCEL載入所有群組與股票代碼(別的執行緒存檔到一半時不讀)
+    with workbook_lock:
+        wb, ws = _open_group_sheet()
 
     groups = {}
-    for col in range(2, ws.max_column + 1):
-        group_name = ws.cell(row=1, column=col).value
+    #一次讀出每一欄的值，不用逐格呼叫ws.cell
+    for column in ws.iter_cols(min_col=2, max_col=ws.max_column, values_only=True):
+        group_name = column[0]
         if not group_name:
             continue
-        stock_list = []
-        for row in range(2, ws.max_row + 1):
-            code = ws.cell(row=row, column=col).value
-            if code:
-                stock_list.append(str(code).strip().upper())
-        groups[group_name] = stock_list
-
-    return groups
\ No newline at end of file
+        groups[group_name] = [str(code).strip().upper() for code in column[1:] if code]
+
+    return groups
+
+
+class GroupStore:
+    """
+    GUI直接操作的記憶體群組資料，寫入EXCEL交給背景執行緒處理
+    連續的修改會在最後一次修改後等待delay秒，合併成一次save_group_data，關閉程式時flush
+    """
+    def __init__(self, delay=GROUP_SAVE_DELAY, default_group="Default Group"):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._dirty = False
+        self._last_change = 0.0
+        try:
+            self.groups = load_group_data() or {default_group: []}
+        except Exception:
+            #如果找不到，就建一個
+            self.groups = {default_group: []}
+        self._worker = threading.Thread(target=self._write_behind, daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
+
+    def snapshot(self):
+        #給背景同步(google sheet)用的複本，避免GUI修改到正在被讀取的資料
+        with self._lock:
+            return {name: list(codes) for name, codes in self.groups.items()}
+
+    def _touch(self):
+        #呼叫前需持有lock
+        self._dirty = True
+        self._last_change = time.monotonic()
+        self._changed.notify()
+
+    def add_code(self, group_name, code):
+        with self._lock:
+            codes = self.groups[group_name]
+            if code in codes:
+                return False
+            codes.append(code)
+            self._touch()
+            return True
+
+    def remove_code(self, group_name, index):
+        with self._lock:
+            del self.groups[group_name][index]
+            self._touch()
+
+    def add_group(self, name):
+        with self._lock:
+            self.groups[name] = []
+            self._touch()
+
+    def rename_group(self, old_name, new_name):
+        #保持群組原本的順序
+        with self._lock:
+            self.groups = {new_name if name == old_name else name: codes for name, codes in self.groups.items()}
+            self._touch()
+
+    def delete_group(self, name):
+        with self._lock:
+            del self.groups[name]
+            self._touch()
+
+    def _write_behind(self):
+        while True:
+            with self._lock:
+                while not self._dirty:
+                    self._changed.wait()
+                #等到最後一次修改後安靜了delay秒才寫入
+                remaining = self._last_change + self.delay - time.monotonic()
+                if remaining > 0:
+                    self._changed.wait(remaining)
+                    continue
+            self.flush()
+
+    def flush(self):
+        #_save_lock確保關閉程式時的flush會等背景執行緒正在進行的存檔完成
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = {name: list(codes) for name, codes in self.groups.items()}
+                self._dirty = False
+            try:
+                save_group_data(snapshot)
+            except Exception as e:
+                #寫入失敗(例如EXCEL被鎖住)時保留dirty，等delay秒後再試
+                print(f"❌ 群組資料寫入EXCEL失敗：{e}")
+                with self._lock:
+                    self._dirty = True
+                    self._last_change = time.monotonic()
\ No newline at end of file
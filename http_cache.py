@@ -0,0 +1,175 @@
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import requests
+from config import HTTP_CACHE_ENABLED, HTTP_CACHE_PATH, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTL, HTTP_CACHE_NOT_FOUND_TTL
+
+#存在APPDATA底下的HTTP回應快取(SQLite)，內容以zlib壓縮
+#在有效期限內直接回傳快取，過期後帶ETag/Last-Modified重新驗證，伺服器回304時沿用快取內容
+#超過容量上限時依最後使用時間淘汰(LRU)
+#404回應也會存(status欄位)，在HTTP_CACHE_NOT_FOUND_TTL內直接當成404，不再重送
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    encoding TEXT,
+    content_type TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    status INTEGER NOT NULL DEFAULT 200
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+"""
+
+
+class CacheEntry:
+    def __init__(self, url, body, encoding, content_type, etag, last_modified, stored_at, status=200):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.encoding = encoding
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def to_response(self):
+        #組回requests.Response，讓呼叫端不用分辨是不是快取
+        resp = requests.Response()
+        resp.url = self.url
+        resp.status_code = self.status
+        if self.status == 404:
+            resp.reason = "Not Found (cached)"
+        resp._content = self.body
+        resp.encoding = self.encoding
+        if self.content_type:
+            resp.headers["Content-Type"] = self.content_type
+        return resp
+
+    def validator_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES, ttl_rules=HTTP_CACHE_TTL):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), seconds) for pattern, seconds in ttl_rules]
+        self.enabled = HTTP_CACHE_ENABLED
+        #revalidate為True時快取一律視為過期，每一頁都向伺服器確認(有ETag/Last-Modified時送條件式請求)
+        self.revalidate = False
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        #舊版快取檔沒有status欄位，補上(原本只存200的回應)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(responses)")]
+        if "status" not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN status INTEGER NOT NULL DEFAULT 200")
+            self._conn.commit()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def count(self, field):
+        #多個爬蟲執行緒會同時累加統計，用lock保護
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats_text(self):
+        return f"🗄 Cache hit {self.hits} | revalidated {self.revalidated} | miss {self.misses}"
+
+    def ttl_for(self, url):
+        for pattern, seconds in self.ttl_rules:
+            if pattern.search(url):
+                return seconds
+        return 0
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, encoding, content_type, etag, last_modified, stored_at, status FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+        body, encoding, content_type, etag, last_modified, stored_at, status = row
+        return CacheEntry(url, zlib.decompress(body), encoding, content_type, etag, last_modified, stored_at, status)
+
+    def is_fresh(self, entry):
+        if self.revalidate:
+            return False
+        ttl = HTTP_CACHE_NOT_FOUND_TTL if entry.status == 404 else self.ttl_for(entry.url)
+        return time.time() - entry.stored_at < ttl
+
+    def store(self, url, resp):
+        body = zlib.compress(resp.content)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body, len(body), resp.encoding, resp.headers.get("Content-Type"),
+                 resp.headers.get("ETag"), resp.headers.get("Last-Modified"), now, now, resp.status_code),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url):
+        #伺服器回304：內容沒變，只更新存入時間讓它重新計算有效期限
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE responses SET stored_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _evict(self):
+        #總容量超過上限時，從最久沒用到的開始刪
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self._conn.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def set_cache_bypass(bypass):
+    #bypass為True時safe_request不讀也不寫快取
+    get_cache().enabled = HTTP_CACHE_ENABLED and not bypass
+
+
+def set_cache_revalidate(revalidate):
+    #完整更新時使用：仍然讀寫快取，但每一頁都先向伺服器確認，伺服器回304才沿用快取內容
+    get_cache().revalidate = revalidate
@@ -0,0 +1,51 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+#有安裝brotli時才宣告支援br，否則伺服器回傳br壓縮的內容requests會無法解開
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+#requests.Session不保證可以跨執行緒共用(cookie等狀態會互相影響)，所以同一時間每個session只給一個執行緒用
+#同一執行緒內的request會重複使用keep-alive連線，不用每次重新做TCP/TLS握手
+#爬蟲的worker執行緒每次爬蟲都會重建，結束的執行緒用過的session留給下一次爬蟲的執行緒接手，
+#連線池在整個程式執行期間都保留，程式結束時才由close_sessions()關閉
+_local = threading.local()
+_owners = {}                # session → 目前使用它的執行緒
+_sessions_lock = threading.Lock()
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": ACCEPT_ENCODING,
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        with _sessions_lock:
+            #優先接手已結束的執行緒留下的session(連線還開著)，沒有才新建
+            session = next((s for s, owner in _owners.items() if not owner.is_alive()), None) or _build_session()
+            _owners[session] = threading.current_thread()
+        _local.session = session
+    return session
+
+
+def close_sessions():
+    #程式結束時呼叫：關閉所有session，釋放連線池
+    with _sessions_lock:
+        for session in _owners:
+            session.close()
+        _owners.clear()
+    _local.__dict__.pop("session", None)
@@ -0,0 +1,45 @@
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from config import LOG_FILE_PATH, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS
+
+#GUI log區域只保留最近的幾行，完整紀錄寫到APPDATA底下會自動輪替的log檔
+#搜尋時逐行掃描log檔，只把符合的行拿出來，不會把整份歷史塞進Tk
+
+
+class LogFile:
+    def __init__(self, path=LOG_FILE_PATH, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.backups = backups
+        self._logger = logging.getLogger(f"usstocksync.gui.{path}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d"))
+            self._logger.addHandler(handler)
+
+    def write(self, text):
+        #text可以是多行(例如log_message收到的分隔線)，每一行各寫一筆
+        for line in text.rstrip("\n").split("\n"):
+            self._logger.info(line)
+
+    def files(self):
+        #由舊到新：usstocksync.log.5 … usstocksync.log.1、usstocksync.log
+        older = [self.path.with_name(f"{self.path.name}.{i}") for i in range(self.backups, 0, -1)]
+        return [p for p in older + [self.path] if p.exists()]
+
+    def search(self, keyword, limit=500):
+        #不分大小寫的關鍵字搜尋，回傳最新的limit筆(由舊到新排列)
+        keyword = keyword.lower()
+        matches = deque(maxlen=limit)
+        for path in self.files():
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        if keyword in line.lower():
+                            matches.append(line.rstrip("\n"))
+            except OSError:
+                continue
+        return list(matches)
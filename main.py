@@ -5,6 +5,7 @@ import shutil
 import time
 import threading
 import datetime
+import multiprocessing
 from pathlib import Path
 #GUI模組（tkinter + ttkbootstrap）
 import tkinter as tk
@@ -15,26 +16,30 @@ from bs4 import BeautifulSoup
 from pandas.io.formats.format import return_docstring
 
 #設定
-from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA
+from config import EXCEL_PATH, CREDENTIALS_PATH, BASE, APPDATA, MAX_CRAWL_WORKERS, FRESHNESS_TTL, LOG_VIEW_MAX_LINES
+from crawler import crawl_codes, collect_results, schedule_all_groups, unique_codes
+from run_metrics import get_metrics
+from analytics import compute_derived
+from column_schema import ColumnSchema
+from ui_queue import UIQueue
+from log_buffer import LogFile
+from http_session import close_sessions
+from http_cache import get_cache, set_cache_bypass, set_cache_revalidate
+from snapshot_store import get_snapshot_store
 from sync import (
     smart_write_to_google_sheet,
     sync_group_to_google_sheet,
     enqueue_group_sync,
     start_group_sync_worker
 )
-from group import (
-    save_group_data,
-    load_group_data,
-    rename_group as rename_group_excel,
-    delete_group as delete_group_excel,
-    update_single_group_column
-)
+from group import GroupStore
 from data_fetcher import (
     is_file_locked,
     close_excel_instances,
     fetch_overview_metrics,
     fetch_financial_metrics,
     fetch_total_debt,
+    fetch_stock_data,
     write_to_excel
 )
 ######################################################import尾端########################################################
@@ -83,19 +88,11 @@ class StockApp:
         self.entry.bind("<Return>", lambda event: self.add_code())
         self.entry.focus_set()
 
-        #將群組名稱初始化為Default
-        self.current_group = "Default Group"
-        self.groups = {self.current_group: []}
-
-        try:
-            self.groups = load_group_data()
-            if self.groups:
-                #如果True 就指定第一項名稱到變數中
-                self.current_group = list(self.groups.keys())[0]
-        except:
-            #如果找不到，就建一個
-            self.groups = {self.current_group: []}
-            #最後呼叫更新群組資料的def
+        #群組資料放在記憶體中的GroupStore，修改後由背景執行緒合併寫回EXCEL(找不到時會建一個Default Group)
+        self.group_store = GroupStore()
+        #指定第一項名稱到變數中
+        self.current_group = list(self.groups.keys())[0]
+        #最後呼叫更新群組資料的def
         self.refresh_stock_list()
 
         #建立群組功能的Frame
@@ -115,8 +112,28 @@ class StockApp:
         tk.Button(btn_frame, text="+ Add", command=self.add_code).grid(row=0, column=0, padx=5)                         # 新增代碼按鈕
         tk.Button(btn_frame, text="🗑 Del", command=self.remove_code).grid(row=0, column=1, padx=5)                      # 刪除代碼按鈕
 
-
-        tk.Button(self.mainframe, text="🔄 Update Data", command=self.update_data).grid(row=7, column=1, padx=10)       # 更新資料按鈕
+        #搜尋完整log紀錄(含已經不在畫面上的舊紀錄)
+        search_frame = tk.Frame(self.mainframe)
+        search_frame.grid(row=8, column=0, padx=5)                                                                      # log搜尋的容器 Frame
+        self.log_search_entry = tk.Entry(search_frame, width=14)
+        self.log_search_entry.grid(row=0, column=0, padx=(0, 3))                                                        # 搜尋關鍵字輸入框
+        self.log_search_entry.bind("<Return>", lambda event: self.search_log())
+        tk.Button(search_frame, text="🔍 Log", command=self.search_log).grid(row=0, column=1)                             # 搜尋log按鈕
+
+
+        self.update_button = tk.Button(self.mainframe, text="🔄 Update Data", command=self.update_data)
+        self.update_button.grid(row=7, column=1, padx=10)                                                               # 更新資料按鈕
+        self.update_all_button = tk.Button(self.mainframe, text="🔄 Update All Groups", command=self.update_all_groups)
+        self.update_all_button.grid(row=8, column=1, padx=10)                                                           # 更新全部群組按鈕
+        self.rebuild_button = tk.Button(self.mainframe, text="📤 Rebuild Sheets", command=self.rebuild_views)
+        self.rebuild_button.grid(row=9, column=1, padx=10)                                                              # 不爬蟲，由歷史資料庫重建EXCEL與google sheet
+        #更新/重建執行中時停用這些按鈕，同一時間只會有一個工作
+        self.job_buttons = [self.update_button, self.update_all_button, self.rebuild_button]
+        self._job_running = False
+        self.bypass_cache_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.mainframe, text="Bypass cache", variable=self.bypass_cache_var).grid(row=7, column=2, sticky="w")  # 勾選後本次更新不使用HTTP快取
+        self.full_refresh_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.mainframe, text="Full refresh", variable=self.full_refresh_var).grid(row=8, column=2, sticky="w")  # 勾選後忽略新鮮度設定，所有頁面都重新抓(快取也要向網站確認)
 
         self.status_label = tk.Label(self.mainframe, text="Last updated record", font=("Arial", 10))
         self.status_label.grid(row=0, column=0, padx=10)                                                                # 資料更新時間狀態 Label
@@ -130,10 +147,28 @@ class StockApp:
         self.progress.grid(row=3, column=1, padx=10, pady=5, sticky="w")                                                # 進度條
         self.progress_label = tk.Label(self.mainframe, text="0%", font=("Arial", 10), bg="SystemButtonFace")
         self.progress_label.place(in_=self.progress, relx=0.5, rely=0.5, anchor="center")                               # 進度條百分比的文字label
+        #log區域只保留最近LOG_VIEW_MAX_LINES行，完整紀錄寫入APPDATA的log檔
+        self.log_file = LogFile()
+        self._log_lines = 0
+        #背景執行緒的log與進度都經過ui_queue，由主執行緒分批更新畫面
+        self.ui = UIQueue(self.root, on_log=self._append_log, on_progress=self._set_progress)
+        self.ui.start()
         #透過trace_add來追蹤group_var的變化，連動觸發start_group_sync_worker，後方的spreadsheet_id於上傳github後刪除
         self.group_var.trace_add("write", self.on_group_change)
         #spreadsheet_id取得方式 為google sheet網址中的 https://docs.google.com/spreadsheets/d/這個位置/edit?gid=0#gid=0
         start_group_sync_worker(spreadsheet_id="<刪除>")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    @property
+    def groups(self):
+        #所有群組資料都以GroupStore為準
+        return self.group_store.groups
+
+    def on_close(self):
+        #關閉視窗前先把尚未寫入的群組資料存回EXCEL，並關閉HTTP連線池
+        self.group_store.flush()
+        close_sessions()
+        self.root.destroy()
 
     def add_code(self):
         code = self.entry.get().strip()
@@ -149,37 +184,85 @@ class StockApp:
             return
 
         code = code.upper()
-        if code and code not in self.groups[self.current_group]:
-            self.groups[self.current_group].append(code)
+        #存入記憶體中的群組(EXCEL由GroupStore稍後一併寫入)，並且透過enqueue排程上傳self.group
+        if code and self.group_store.add_code(self.current_group, code):
             self.stock_listbox.insert(tk.END, code)
             self.entry.delete(0, tk.END)
-
-        #呼叫def將新增的股票代碼存入陣列中，並且透過enqueue排程上傳self.group
-        update_single_group_column(self.current_group, self.groups[self.current_group])
-        enqueue_group_sync(self.groups)
+            enqueue_group_sync(self.group_store.snapshot())
 
 
     def remove_code(self):
         selected = self.stock_listbox.curselection()
         if selected:
             idx = selected[0]
-            del self.groups[self.current_group][idx]
+            self.group_store.remove_code(self.current_group, idx)
             self.stock_listbox.delete(idx)
-        # 呼叫def將刪除之後剩下的股票代碼存入陣列中，並且透過enqueue排程上傳self.group
-        update_single_group_column(self.current_group, self.groups[self.current_group])
-        enqueue_group_sync(self.groups)
+            # 刪除之後剩下的股票代碼由GroupStore寫回EXCEL，並且透過enqueue排程上傳self.group
+            enqueue_group_sync(self.group_store.snapshot())
 
 
     def update_data(self):
+        #沒有代碼時在主執行緒提示，不進背景執行緒
+        if not self.groups[self.current_group]:
+            messagebox.showinfo("提示", "請先新增股票代碼")
+            return
         #背景執行target(這邊指定_crawl_data是為了避免在爬蟲的過程中console不會更新，提高流暢的感覺
-        threading.Thread(target=self._crawl_data, daemon=True).start()
+        self._start_job(self._crawl_data, **self._crawl_options())
+
+    def update_all_groups(self):
+        #所有群組一起更新，重複出現在多個群組的代碼只爬一次
+        self._start_job(self._crawl_data, **self._crawl_options(all_groups=True))
+
+    def _start_job(self, target, *args, **kwargs):
+        #快取統計與各階段耗時是整個程式共用的，兩次更新重疊時會互相歸零、混在一起，所以一次只跑一個
+        #_job_running只在主執行緒讀寫，背景執行緒結束時透過ui.call恢復按鈕
+        if self._job_running:
+            return
+        self._set_job_buttons(False)
 
-    def _crawl_data(self):
-        codes = self.groups[self.current_group]
+        def run():
+            try:
+                target(*args, **kwargs)
+            finally:
+                self.ui.call(self._set_job_buttons, True)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _set_job_buttons(self, enabled):
+        self._job_running = not enabled
+        for button in self.job_buttons:
+            button.config(state="normal" if enabled else "disabled")
+
+    def _crawl_options(self, **kwargs):
+        #勾選框的狀態在主執行緒讀好再傳給背景執行緒，背景執行緒不碰Tk變數
+        return dict(kwargs, bypass_cache=self.bypass_cache_var.get(), full_refresh=self.full_refresh_var.get())
+
+    def rebuild_views(self):
+        #不連網，所有群組的代碼直接由歷史資料庫輸出最新的資料
+        codes = unique_codes(code for codes in self.group_store.snapshot().values() for code in codes)
+        self._start_job(self._rebuild_views, codes)
+
+    def _rebuild_views(self, codes):
+        if not codes:
+            self.log_message("沒有可輸出的股票代碼")
+            return
+        sheet_job = self.export_views(codes)
+        if sheet_job is None:
+            self.log_message("⚠️ 歷史資料庫中沒有這些代碼的資料，請先更新")
+            return
+        sheet_job.result()
+        self.log_message(f"----------------Rebuild Completed（{len(codes)} tickers）----------------")
+
+    def _crawl_data(self, all_groups=False, bypass_cache=False, full_refresh=False):
+        if all_groups:
+            #目前群組優先，其餘依最久沒更新的先爬
+            codes = schedule_all_groups(self.group_store.snapshot(), self.current_group)
+        else:
+            codes = list(self.groups[self.current_group])
         total = len(codes)
 
         if not codes:
-            messagebox.showinfo("提示", "請先新增股票代碼")
+            self.log_message("沒有可更新的股票代碼")
             return
 
         today = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -189,75 +272,118 @@ class StockApp:
         )
 
         #初始化進度條及值
-        self.progress["value"] = 0
-        self.progress["maximum"] = total
-
-        #初始化爬蟲的字典、陣列、還有成功連線的數量
-        extra_data_dict = {}
-        all_data_rows = []  # ← 累積成功資料
-        success_count = 0
-
-        #從codes的第一筆開始迴圈到最後一筆
-        for index, code in enumerate(codes, 1):
-            #先從連線過程會遇到的情況開始列舉
-            try:
-                #發出request
-                response = requests.get(f"https://stockanalysis.com/stocks/{code}/", timeout=10)
-                if response.status_code != 200:
-                    raise Exception("連線失敗")
-
-                #BeautifulSoup為解析指定網站的原始碼
-                soup = BeautifulSoup(response.text, "html.parser")
-                #先抓標題(這邊會抓到公司名稱)
-                title = soup.title.string if soup.title else "Unknown resolution"
-                title = title.replace(f" ({code}) Stock Price & Overview", "").strip()
-                self.log_message(f"✅ {code} | {title}")
-
-                # 資料擷取完成後的各變數，各變數來源自後方的def(這邊共送出三次request)
-                code, shares_out, pe_ratio, price_target = fetch_overview_metrics(code)
-                financials = fetch_financial_metrics(code)
-                td_data = fetch_total_debt(code)
-                financials.update(td_data)
-
-                # 加入成功清單
-                extra_data_dict[code] = {
-                    **financials,
-                    "公司名稱": title
-                }
-                all_data_rows.append((code, shares_out, pe_ratio, price_target))
-                success_count += 1
+        self.ui.progress(0, total)
+
+        #每完成一檔就回報一次，依完成的數量更新進度條
+        def on_result(done_count, result):
+            if result.ok:
+                if result.pages:
+                    self.log_message(f"✅ {result.code} | {result.name}")
+                else:
+                    self.log_message(f"⏩ {result.code} | 資料仍在有效期限內，略過")
+            else:
+                self.log_message(f"{result.code} ❌ attach fail：{result.error}")
+
+            # 更新進度條(同一個畫面更新週期內只會套用最後一筆)
+            self.ui.progress(done_count, total)
+
+        #依勾選狀態決定是否略過HTTP快取，並歸零本次的快取統計與各階段耗時
+        cache = get_cache()
+        set_cache_bypass(bypass_cache)
+        #完整更新時快取的頁面也要先向網站確認，不會拿到最多一天前的內容
+        set_cache_revalidate(full_refresh)
+        cache.reset_stats()
+        metrics = get_metrics()
+        metrics.reset()
+
+        #一般更新只抓過期的頁面，勾選完整更新時全部重新抓
+        store = get_snapshot_store()
+        plan = None if full_refresh else store.pages_to_refresh(codes)
+        if plan is not None:
+            pages = sum(len(p) for p in plan.values())
+            self.log_message(f"本次需抓取 {pages} / {len(codes) * len(FRESHNESS_TTL)} 個頁面")
+
+        #併發爬取，結果依照群組中的順序回傳
+        results = crawl_codes(codes, max_workers=MAX_CRAWL_WORKERS, on_result=on_result, plan=plan)
+        records, fetched_pages = collect_results(results)
+        success_count = len(fetched_pages)
+        if cache.enabled:
+            self.log_message(cache.stats_text())
+
+        # 爬完之後，先把成功的資料記錄到本地歷史資料庫，再由資料庫輸出到excel與google sheet
+        if fetched_pages:
+            store.record_crawl(records, fetched_pages)
+            sheet_job = self.export_views(list(fetched_pages))
+            #等google sheet寫完，耗時統計才包含Sheets API
+            if sheet_job:
+                sheet_job.result()
+
+        #各階段耗時摘要，完整資料另外寫到run_metrics.jsonl
+        for line in metrics.summary_lines():
+            self.log_message(line)
+        try:
+            metrics.export(mode="gui", tickers_total=total, succeeded=success_count)
+        except OSError as e:
+            self.log_message(f"⚠️ 寫入耗時紀錄失敗：{e}")
 
-            except Exception as e:
-                self.log_message(f"{code} ❌ attach fail：{e}")
+        #整理時間格式，並寫入GUI左上角的label
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.ui.call(self.status_label.config, text=f"Last updated：{now}")
+        self.log_message(f"----------------Update Completed（Finished {success_count} /  {total}）----------------")
 
-            # 更新進度條
-            self.progress["value"] = index
-            self.progress.update_idletasks()
-            #這邊index一定要是int，不然會出錯
-            self.progress_label.config(text=f"{int((index / total) * 100)}%")
+    def ask_on_main_thread(self, fn, *args):
+        #背景執行緒需要跳出視窗(messagebox)時，交給Tk主執行緒執行並等待結果
+        done = threading.Event()
+        result = {}
 
-        # 爬完之後，最後再一起寫入成功的資料
-        if all_data_rows:
-            #寫入本地excel檔
+        def run():
+            try:
+                result["value"] = fn(*args)
+            finally:
+                done.set()
+
+        self.ui.call(run)
+        done.wait()
+        return result.get("value")
+
+    def export_views(self, codes):
+        #從歷史資料庫取出每檔最新的資料，重建excel與google sheet(不需要連網爬蟲)
+        records = get_snapshot_store().latest(codes)
+        if not records:
+            return
+        #衍生指標(Upside、FCF Yield…)一次算完，跟原始資料一起寫出去
+        with get_metrics().timer("analytics"):
+            records += compute_derived(records)
+        #欄位對應與順序只算一次，EXCEL與google sheet共用
+        schema = ColumnSchema(records)
+        #寫入本地excel檔：這裡在背景執行緒，EXCEL開著時的詢問視窗交給主執行緒顯示，write_to_excel本身不碰Tk
+        force_close = False
+        if is_file_locked(self.file_path):
+            force_close = self.ask_on_main_thread(
+                messagebox.askyesno,
+                "Excel 檔案已開啟",
+                f"{self.file_path.name} 檔案目前正在被 Excel 使用中。\n\n是否要強制關閉它來更新資料？（請確保檔案已儲存變更）",
+            )
+        try:
             write_to_excel(
-                all_data_rows,
-                extra_data_dict=extra_data_dict,
+                records,
                 file_path=str(self.file_path),
                 sheet_name="Crawl_data",
+                interactive=False,
+                force_close=force_close,
+                reopen=force_close,
+                schema=schema,
             )
-            #寫入雲端google sheet(spreadsheet_id於上傳github時刪除)
-            smart_write_to_google_sheet(
-                all_data_rows,
-                extra_data_dict=extra_data_dict,
-                spreadsheet_id="<刪除>",
-                sheet_name="Crawl_data",
-                log_fn=self.log_message
-            )
-
-        #整理時間格式，並寫入GUI左上角的label
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.status_label.config(text=f"Last updated：{now}")
-        self.log_message(f"----------------Update Completed（Finished {success_count} /  {total}）----------------")
+        except PermissionError as e:
+            self.log_message(f"⚠️ 未寫入EXCEL：{e}，請先關閉Excel檔案後再執行")
+        #寫入雲端google sheet(spreadsheet_id於上傳github時刪除)，回傳背景寫入的Future
+        return smart_write_to_google_sheet(
+            records,
+            spreadsheet_id="<刪除>",
+            sheet_name="Crawl_data",
+            log_fn=self.log_message,
+            schema=schema,
+        )
 
     def update_group_menu(self):
         #將字典的值丟到combox的選項裡面
@@ -304,12 +430,11 @@ class StockApp:
             return
 
         #將剛剛合格的群組name新增到groups字典中
-        self.groups[name] = []
+        self.group_store.add_group(name)
         self.current_group = name
         self.update_group_menu()
         self.refresh_stock_list()
-        save_group_data(self.groups)
-        enqueue_group_sync(self.groups)#排程進enqueue進行背景同步
+        enqueue_group_sync(self.group_store.snapshot())#排程進enqueue進行背景同步
 
 
     def rename_group(self):
@@ -325,50 +450,86 @@ class StockApp:
             messagebox.showinfo("錯誤", "群組名稱已存在")
             return  #字典中查到同名return
 
-        # 將舊群組資料轉移並刪除舊的
-        self.groups[new_name] = self.groups.pop(old_name)
+        # 將舊群組資料轉移到新名稱(本地excel由GroupStore整頁重寫)
+        self.group_store.rename_group(old_name, new_name)
         self.current_group = new_name
         self.update_group_menu()
         self.refresh_stock_list()
-        #呼叫轉移本地excel資料的def
-        rename_group_excel(old_name, new_name)
-        save_group_data(self.groups)
         #因為google sheet都是整頁clear掉才重新輸入，所以不用特地重寫一個rename的def
-        enqueue_group_sync(self.groups)  # 推進最新資料
+        enqueue_group_sync(self.group_store.snapshot())  # 推進最新資料
 
 
     def delete_group(self):
         if len(self.groups) == 1:
             messagebox.showinfo("提示", "至少需要保留一個群組")
             return
-        del self.groups[self.current_group]
+        self.group_store.delete_group(self.current_group)
         self.current_group = list(self.groups.keys())[0]
         self.update_group_menu()
         self.refresh_stock_list()
-        save_group_data(self.groups)
-        enqueue_group_sync(self.groups)
+        enqueue_group_sync(self.group_store.snapshot())
 
 
     def log_message(self, message):
-        #console使用，先建好時間模板的變數
+        #任何執行緒都可以呼叫：時間在呼叫當下記錄，實際寫入畫面由主執行緒批次處理
         now = time.strftime("%H:%M:%S")
         full_message = f"[{now}] {message}\n"
-        #tk模板預設唯獨，state要改normal才能寫入
+        try:
+            self.log_file.write(full_message)
+        except OSError:
+            pass
+        self.ui.log(full_message)
+
+    def _append_log(self, lines):
+        #tk模板預設唯獨，state要改normal才能寫入，一批log只切換一次、insert一次
         self.log_area.config(state="normal")
-        #匯入訊息
-        self.log_area.insert(tk.END, full_message)
+        text = "".join(lines)
+        self.log_area.insert(tk.END, text)
+        #超過上限時從最上方刪掉最舊的行(這些行已經在log檔裡)
+        self._log_lines += text.count("\n")
+        excess = self._log_lines - LOG_VIEW_MAX_LINES
+        if excess > 0:
+            self.log_area.delete("1.0", f"{excess + 1}.0")
+            self._log_lines -= excess
         #滑動到最下方
         self.log_area.see(tk.END)
         #設定唯獨
         self.log_area.config(state="disabled")
 
+    def search_log(self):
+        #在背景掃描log檔，只把符合的行顯示在另外的視窗
+        keyword = self.log_search_entry.get().strip()
+        if not keyword:
+            return
+
+        def run():
+            matches = self.log_file.search(keyword)
+            self.ui.call(self._show_log_matches, keyword, matches)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _show_log_matches(self, keyword, matches):
+        window = tk.Toplevel(self.root)
+        window.title(f"🔍 {keyword}（{len(matches)}）")
+        area = scrolledtext.ScrolledText(window, width=110, height=25, font=("Courier New", 10))
+        area.pack(fill="both", expand=True)
+        area.insert(tk.END, "\n".join(matches) if matches else "找不到符合的紀錄")
+        area.see(tk.END)
+        area.config(state="disabled")
+
+    def _set_progress(self, done, total):
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+        #這邊index一定要是int，不然會出錯
+        self.progress_label.config(text=f"{int((done / total) * 100) if total else 0}%")
+
     def run_crawler(self):
         #先辨識current的群組，再透過list把這群組的每筆資料傳入codes這個陣列中
         codes = list(self.groups[self.current_group])
-        #建立一個迴圈，內容是將每筆股票代碼丟到爬蟲裡面並回傳結果到results這個陣列中
-        results = [fetch_overview_metrics(code) for code in codes]
+        #建立一個迴圈，內容是將每筆股票代碼丟到爬蟲裡面並把結果的records收集起來
+        records = [record for code in codes for record in fetch_stock_data(code)[0]]
         #將每一筆結果丟到本地excel中
-        write_to_excel(results)
+        write_to_excel(records)
 
 
 def try_close_excel_or_abort():
@@ -385,6 +546,8 @@ def try_close_excel_or_abort():
 
 #主程序
 if __name__ == "__main__":
+    #打包成exe時，process pool的子process需要這行才不會重新開啟視窗
+    multiprocessing.freeze_support()
     #自動補檔案，分別是金鑰跟EXCEL檔
     for filename in ["爬蟲更新區.xlsm", "credentials.json"]:
         dest = APPDATA / filename
@@ -0,0 +1,137 @@
+import re
+
+#爬蟲資料的基本單位：一檔股票的一個數值(某個期間)
+#數值在抓取時就解析成float(value)，同時保留網站上的原始文字(text)給EXCEL/google sheet顯示
+#欄位名稱(EPS(2024)、Free Cash Flow(TTM)…)由record自己算，寫入端不用再拆字串
+
+NAME_METRIC = "公司名稱"
+OVERVIEW_METRICS = ["SharesOut", "PE Ratio", "Price Target", "Market Cap"]
+#analytics.py由原始資料算出的衍生指標
+DERIVED_METRICS = ["Upside", "FCF Yield", "Debt/FCF", "EPS CAGR"]
+
+#財報項目 → EXCEL/google sheet欄位名稱的前綴
+COLUMN_PREFIX = {
+    "EPS (Basic)": "EPS",
+    "Free Cash Flow": "Free Cash Flow",
+    "Total Debt": "Total Debt",
+}
+
+#財報表格的金額以百萬為單位顯示，轉成實際金額
+UNIT_SCALE = {
+    "Free Cash Flow": 1e6,
+    "Total Debt": 1e6,
+}
+
+_SUFFIX = {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12, "%": 0.01}
+_NUMBER_RE = re.compile(r"^([-+]?(?:\d[\d,]*)?\.?\d+)\s*([KMBT%]?)")
+
+#"EPS (Basic) (FY 2024)" → ("EPS (Basic)", "FY 2024")
+_KEY_RE = re.compile(r"^(.*) \(([^()]*)\)$")
+
+
+def split_key(key):
+    match = _KEY_RE.match(key)
+    if match:
+        return match.group(1), match.group(2)
+    return key, ""
+
+
+def join_key(metric, period):
+    return f"{metric} ({period})" if period else metric
+
+
+def parse_number(text):
+    """
+    網站顯示的文字轉成數字：1.23B → 1.23e9、-5.2% → -0.052、1,234 → 1234、(12.5) → -12.5
+    Price Target的 "179.90 (+24.76%)" 只取前面的價格；"-"、"n/a"等無法解析的回傳None
+    """
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    text = str(text).strip().replace("−", "-")
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1].strip()
+    match = _NUMBER_RE.match(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "")) * _SUFFIX.get(match.group(2), 1)
+    return -value if negative else value
+
+
+def period_year(period):
+    #TTM → 9999、FY 2024 → 2024、其他 → -1(排序用，TTM排最前面)
+    if period == "TTM":
+        return 9999
+    if period.startswith("FY ") and period[3:].isdigit():
+        return int(period[3:])
+    return -1
+
+
+def statement_column(prefix, year):
+    #財報欄位名稱：("EPS", 9999) → "EPS(TTM)"、("EPS", 2024) → "EPS(2024)"
+    return f"{prefix}({'TTM' if year == 9999 else year})"
+
+
+def normalize_column(name):
+    #EXCEL標題(EPS(2024)、EPS (TTM)…)轉成record.column的寫法，不是財報欄位時回傳None
+    for prefix in COLUMN_PREFIX.values():
+        if name.startswith(prefix):
+            if "TTM" in name:
+                return f"{prefix}(TTM)"
+            return f"{prefix}({name[name.find('(') + 1:name.find(')')]})"
+    return None
+
+
+class MetricRecord:
+    __slots__ = ("ticker", "metric", "period", "value", "text")
+
+    def __init__(self, ticker, metric, period, text, value=None):
+        self.ticker = ticker
+        self.metric = metric
+        self.period = period
+        self.text = text
+        if value is None and metric != NAME_METRIC:
+            value = parse_number(text)
+            if value is not None:
+                value *= UNIT_SCALE.get(metric, 1)
+        self.value = value
+
+    @classmethod
+    def from_key(cls, ticker, key, text):
+        metric, period = (key, "") if key == NAME_METRIC else split_key(key)
+        return cls(ticker, metric, period, text)
+
+    @property
+    def key(self):
+        return join_key(self.metric, self.period)
+
+    @property
+    def year(self):
+        return period_year(self.period)
+
+    @property
+    def column(self):
+        #EXCEL/google sheet的欄位名稱
+        prefix = COLUMN_PREFIX.get(self.metric)
+        if prefix is None:
+            return self.metric
+        return statement_column(prefix, self.year)
+
+    @property
+    def is_statement(self):
+        #財報項目(依年度展開成多個欄位)
+        return self.metric in COLUMN_PREFIX
+
+    def __repr__(self):
+        return f"MetricRecord({self.ticker!r}, {self.key!r}, {self.text!r}, value={self.value!r})"
+
+
+def build_records(row, extra):
+    #舊格式(code, shares_out, pe_ratio, price_target, market_cap) + {"EPS (Basic) (FY 2024)": ..., "公司名稱": ...} 轉成records
+    #row中為None的值代表沒有抓，略過
+    ticker = row[0].strip().upper()
+    records = [MetricRecord(ticker, metric, "", text) for metric, text in zip(OVERVIEW_METRICS, row[1:]) if text is not None]
+    records.extend(MetricRecord.from_key(ticker, key, text) for key, text in (extra or {}).items())
+    return records
@@ -0,0 +1,189 @@
+import json
+import math
+
+#stockanalysis.com是SvelteKit網站，每一頁在網址後加上__data.json就能拿到該頁面使用的原始資料
+#回傳格式為 {"type": "data", "nodes": [{"type": "data", "data": [...]}, ...]}
+#每個node的data是devalue壓平後的陣列：data[0]是根物件，物件與陣列裡的值都是指向data的索引
+#這邊把它還原成一般的dict/list，再從中找出爬蟲要的欄位，找不到時交給呼叫端退回HTML解析
+#欄位只在各node根物件底下固定的區塊裡找(info、quote…)，同業、新聞、指數等巢狀物件也有name/pe欄位，不能整棵樹搜尋
+
+DATA_SUFFIX = "__data.json"
+
+#devalue保留的負數索引
+_SPECIAL = {
+    -1: None,            # undefined
+    -2: None,            # 陣列中的空洞
+    -3: math.nan,
+    -4: math.inf,
+    -5: -math.inf,
+    -6: -0.0,
+}
+
+#JSON欄位名稱對應到HTML表格的列名稱，網站改名時只要改這邊
+TABLE_FIELDS = {
+    "EPS (Basic)": ("epsBasic", "eps_basic"),
+    "Free Cash Flow": ("fcf", "freeCashFlow"),
+    "Total Debt": ("debt", "totalDebt"),
+}
+PERIOD_FIELDS = ("fiscalYear", "fiscal_year")
+
+OVERVIEW_FIELDS = {
+    "Shares Out": ("sharesOut", "shares_out"),
+    "PE Ratio": ("peRatio", "pe_ratio", "pe"),
+    "Price Target": ("target", "priceTarget"),
+    "Market Cap": ("marketCap", "market_cap"),
+}
+NAME_FIELDS = ("nameFull", "name")
+PRICE_FIELDS = ("p", "price")
+
+#各資料在node根物件底下的區塊名稱
+INFO_NODES = ("info",)
+QUOTE_NODES = ("quote",)
+OVERVIEW_NODES = ("data",)
+TABLE_NODES = ("financialData", "data")
+
+
+def unflatten(values):
+    if isinstance(values, int):
+        return _SPECIAL.get(values)
+    hydrated = {}
+
+    def hydrate(index):
+        if index in _SPECIAL:
+            return _SPECIAL[index]
+        if index in hydrated:
+            return hydrated[index]
+        value = values[index]
+        if isinstance(value, list):
+            #["Date", "..."]、["Set", ...]等特殊型別只取原始值，其餘為一般陣列
+            if value and isinstance(value[0], str):
+                kind = value[0]
+                if kind == "Date":
+                    result = value[1]
+                elif kind in ("Set", "Map", "Object"):
+                    result = [hydrate(i) for i in value[1:]]
+                else:
+                    result = value[1] if len(value) > 1 else None
+                hydrated[index] = result
+                return result
+            result = []
+            hydrated[index] = result
+            result.extend(hydrate(i) for i in value)
+            return result
+        if isinstance(value, dict):
+            result = {}
+            hydrated[index] = result
+            for key, i in value.items():
+                result[key] = hydrate(i)
+            return result
+        hydrated[index] = value
+        return value
+
+    return hydrate(0)
+
+
+def load_nodes(text):
+    #解析__data.json，回傳每個有資料的node還原後的物件
+    payload = json.loads(text)
+    if payload.get("type") != "data":
+        return []
+    nodes = []
+    for node in payload.get("nodes") or []:
+        if node and node.get("type") == "data" and node.get("data"):
+            nodes.append(unflatten(node["data"]))
+    return nodes
+
+
+def _pick(d, names):
+    for name in names:
+        if name in d:
+            return d[name]
+    return None
+
+
+def route_dict(nodes, keys):
+    #依keys的順序，回傳第一個node根物件底下該名稱的dict
+    for key in keys:
+        for node in nodes:
+            value = node.get(key) if isinstance(node, dict) else None
+            if isinstance(value, dict):
+                return value
+    return None
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def format_abbreviated(value):
+    #跟網站overview表格一樣的縮寫格式：15.04B、812.33M
+    for limit, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= limit:
+            return f"{value / limit:.2f}{suffix}"
+    return f"{value:.2f}"
+
+
+def format_price_target(target, price):
+    #跟網站overview表格一樣附上相對現價的漲幅："179.90 (+24.76%)"，沒有現價時回傳None改用HTML
+    if not _is_number(price) or price <= 0:
+        return None
+    return f"{target:.2f} ({(target / price - 1) * 100:+.2f}%)"
+
+
+def format_statement_value(label, value):
+    #財報表格顯示的格式：EPS兩位小數，金額以百萬為單位加千分位
+    if label.startswith("EPS"):
+        return f"{value:.2f}"
+    return f"{value / 1e6:,.0f}"
+
+
+def extract_json_table(nodes, labels):
+    #回傳格式與data_fetcher.extract_table_rows相同：{"EPS (Basic) (FY 2024)": "6.11", ...}
+    data = {}
+    wanted = [TABLE_FIELDS[lbl] for lbl in labels if lbl in TABLE_FIELDS]
+    if not wanted:
+        return data
+    table = route_dict(nodes, TABLE_NODES)
+    periods = _pick(table, PERIOD_FIELDS) if table else None
+    if not isinstance(periods, list):
+        return data
+    for lbl in labels:
+        series = _pick(table, TABLE_FIELDS.get(lbl, ()))
+        if not isinstance(series, list):
+            continue
+        for period, value in zip(periods, series):
+            if not _is_number(value):
+                continue
+            period = str(period)
+            yr = "TTM" if period.upper() == "TTM" else f"FY {period}"
+            data[f"{lbl} ({yr})"] = format_statement_value(lbl, value)
+    return data
+
+
+def table_complete(data, labels):
+    #每個項目都有資料，而且各項目的期間都相同(沒有缺某一年)，否則呼叫端要用HTML補
+    periods = [{key[len(lbl) + 2:-1] for key in data if key.startswith(f"{lbl} (")} for lbl in labels]
+    return all(periods) and all(p == periods[0] for p in periods)
+
+
+def extract_json_overview(nodes):
+    #回傳 (公司名稱, shares_out, pe_ratio, price_target, market_cap)，找不到的欄位為None
+    info = route_dict(nodes, INFO_NODES)
+    stats = route_dict(nodes, OVERVIEW_NODES)
+    quote = route_dict(nodes, QUOTE_NODES)
+    name = _pick(info, NAME_FIELDS) if info else None
+    price = _pick(quote, PRICE_FIELDS) if quote else None
+    values = []
+    for label, names in OVERVIEW_FIELDS.items():
+        value = _pick(stats, names) if stats else None
+        if _is_number(value):
+            if label in ("Shares Out", "Market Cap"):
+                value = format_abbreviated(value)
+            elif label == "Price Target":
+                value = format_price_target(value, price)
+            else:
+                value = f"{value:.2f}"
+        elif not isinstance(value, str) or not value:
+            value = None
+        values.append(value)
+    return (name, *values)
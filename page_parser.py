@@ -0,0 +1,143 @@
+from config import HTML_PARSER_BACKEND
+
+#HTML解析後端：依安裝狀況選用selectolax > lxml > BeautifulSoup
+#每個後端只提供爬蟲需要的三種操作：標題、所有<td>文字、第一個<table>的表頭與各列
+#文字一律用「每段文字strip後直接相接」的規則，跟BeautifulSoup的get_text(strip=True)結果一致
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def __init__(self):
+        #selectolax 1.0之後改用lexbor引擎，舊版只有modest的HTMLParser
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:
+            from selectolax.parser import HTMLParser
+        self._parser = HTMLParser
+
+    def parse(self, html):
+        return self._parser(html)
+
+    def title(self, doc):
+        node = doc.css_first("title")
+        return node.text(strip=True) if node else None
+
+    def cell_texts(self, doc):
+        return [td.text(separator="", strip=True) for td in doc.css("td")]
+
+    def first_table(self, doc):
+        table = doc.css_first("table")
+        if table is None:
+            return None
+        headers = [th.text(separator="", strip=True) for th in table.css("thead th")]
+        rows = [[td.text(separator="", strip=True) for td in tr.css("td")] for tr in table.css("tbody tr")]
+        return headers, rows
+
+
+class LxmlBackend:
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        self._fromstring = lxml.html.fromstring
+
+    @staticmethod
+    def _text(el):
+        return "".join(part.strip() for part in el.itertext())
+
+    def parse(self, html):
+        return self._fromstring(html)
+
+    def title(self, doc):
+        el = doc.find(".//title")
+        return self._text(el) if el is not None else None
+
+    def cell_texts(self, doc):
+        return [self._text(td) for td in doc.iter("td")]
+
+    def first_table(self, doc):
+        table = doc.find(".//table")
+        if table is None:
+            return None
+        headers = [self._text(th) for th in table.findall("./thead//th")]
+        rows = [[self._text(td) for td in tr.findall("./td")] for tr in table.findall("./tbody/tr")]
+        return headers, rows
+
+
+class SoupBackend:
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+        #有lxml時讓BeautifulSoup用lxml建樹，比純Python的html.parser快很多
+        try:
+            import lxml  # noqa: F401
+            self._features = "lxml"
+        except ImportError:
+            self._features = "html.parser"
+
+    def parse(self, html):
+        return self._soup(html, self._features)
+
+    def title(self, doc):
+        return doc.title.string if doc.title else None
+
+    def cell_texts(self, doc):
+        return [td.get_text(strip=True) for td in doc.find_all("td")]
+
+    def first_table(self, doc):
+        table = doc.find("table")
+        if not table or not table.thead or not table.tbody:
+            return None
+        headers = [th.get_text(strip=True) for th in table.thead.find_all("th")]
+        rows = [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in table.tbody.find_all("tr")]
+        return headers, rows
+
+
+BACKENDS = {
+    "selectolax": SelectolaxBackend,
+    "lxml": LxmlBackend,
+    "bs4": SoupBackend,
+}
+
+_backends = {}
+
+
+def get_backend(name=None):
+    #name為None時使用config的設定，"auto"則依序嘗試可用的後端
+    name = name or HTML_PARSER_BACKEND
+    if name in _backends:
+        return _backends[name]
+    candidates = list(BACKENDS) if name == "auto" else [name]
+    for candidate in candidates:
+        try:
+            backend = BACKENDS[candidate]()
+        except ImportError:
+            continue
+        _backends[name] = backend
+        return backend
+    raise ImportError(f"找不到可用的HTML解析後端：{name}")
+
+
+#解析一次後可重複查詢的頁面，查詢結果也會記住，避免同一份文件被重複走訪
+class ParsedPage:
+    def __init__(self, html, backend=None):
+        self.backend = backend or get_backend()
+        self.doc = self.backend.parse(html)
+        self._cells = None
+        self._table = False
+
+    def title(self):
+        return self.backend.title(self.doc)
+
+    def cell_texts(self):
+        if self._cells is None:
+            self._cells = self.backend.cell_texts(self.doc)
+        return self._cells
+
+    def first_table(self):
+        if self._table is False:
+            self._table = self.backend.first_table(self.doc)
+        return self._table
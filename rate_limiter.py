@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from config import (
+    RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX,
+    RATE_LIMIT_INCREASE, RATE_LIMIT_DECREASE, RATE_LIMIT_BURST,
+)
+
+#同一個網站的所有爬蟲執行緒共用一個限速器(token bucket)
+#回應正常時慢慢加速(加法)，遇到429時整體砍半(乘法)並依Retry-After暫停整個網站的request
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=RATE_LIMIT_INITIAL, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX,
+                 increase=RATE_LIMIT_INCREASE, decrease=RATE_LIMIT_DECREASE, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._pause_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        #拿到一個token才能送出request，拿不到就睡到下一個token產生(或暫停結束)為止
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._pause_until:
+                    wait = self._pause_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            #同一波429可能同時打回好幾個執行緒，一秒內只降速一次，避免速度被連續砍到底
+            if now - self._last_decrease >= 1:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = now
+            self._tokens = 0.0
+            if retry_after:
+                self._pause_until = max(self._pause_until, now + retry_after)
+
+
+def parse_retry_after(value):
+    #Retry-After可能是秒數，也可能是HTTP日期
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None, base=3, cap=60):
+    #指數退避加上隨機抖動，伺服器有給Retry-After時至少等那麼久
+    delay = min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+    if retry_after:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return delay
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(host):
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = AdaptiveRateLimiter()
+        return _limiters[host]
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from config import RUN_METRICS_PATH
+
+#一次更新(爬蟲 + 寫入)各階段的耗時與計數，用來找出慢在網路、429等待、解析、EXCEL存檔還是Sheets API
+#各模組在熱路徑上呼叫 get_metrics().timer("stage")、incr("counter")，更新結束後寫一行JSON到RUN_METRICS_PATH
+#在ticker_scope裡面記錄的耗時，會同時累加到那一檔股票底下
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._started = time.perf_counter()
+            self.stages = {}        # stage → [次數, 總秒數, 最長秒數]
+            self.counters = {}      # 名稱 → 數量
+            self.tickers = {}       # ticker → {stage: 秒數}
+
+    def add_time(self, stage, seconds, ticker=None):
+        ticker = ticker or getattr(self._local, "ticker", None)
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if ticker:
+                per_ticker = self.tickers.setdefault(ticker, {})
+                per_ticker[stage] = per_ticker.get(stage, 0.0) + seconds
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, stage, ticker=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, ticker)
+
+    @contextmanager
+    def ticker_scope(self, ticker):
+        #這個執行緒在scope裡記錄的耗時都算到ticker底下，結束時另外記一筆ticker_total
+        previous = getattr(self._local, "ticker", None)
+        self._local.ticker = ticker
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time("ticker_total", time.perf_counter() - start, ticker)
+            self._local.ticker = previous
+
+    def to_dict(self, **extra):
+        with self._lock:
+            return {
+                "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "elapsed": round(time.perf_counter() - self._started, 3),
+                **extra,
+                "stages": {stage: {"count": c, "total": round(t, 3), "max": round(m, 3)}
+                           for stage, (c, t, m) in self.stages.items()},
+                "counters": dict(self.counters),
+                "tickers": {ticker: {stage: round(t, 3) for stage, t in stages.items()}
+                            for ticker, stages in self.tickers.items()},
+            }
+
+    def summary_lines(self):
+        #給log區域看的摘要：各階段依總耗時排序，再加上計數與最慢的幾檔
+        data = self.to_dict()
+        lines = [f"⏱ 總耗時 {data['elapsed']:.1f}s"]
+        for stage, s in sorted(data["stages"].items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"   {stage:<14}{s['total']:>9.2f}s  x{s['count']:<5} max {s['max']:.2f}s")
+        counters = data["counters"]
+        if counters:
+            lines.append("   " + "、".join(f"{name} {value}" for name, value in sorted(counters.items())))
+        slowest = sorted(data["tickers"].items(), key=lambda item: -item[1].get("ticker_total", 0))[:3]
+        if slowest:
+            lines.append("   最慢：" + "、".join(f"{t} {s.get('ticker_total', 0):.1f}s" for t, s in slowest))
+        return lines
+
+    def export(self, path=RUN_METRICS_PATH, **extra):
+        #每次更新append一行，方便跨次比較是否變慢
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict(**extra), ensure_ascii=False) + "\n")
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics():
+    return _metrics
@@ -0,0 +1,93 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gspread
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from config import CREDENTIALS_PATH, SHEETS_MAX_WORKERS, SHEETS_TOKEN_REFRESH_MARGIN
+
+#sync.py透過這層存取google sheet，不直接呼叫gspread
+#回傳的worksheet只會用到下列方法(與gspread.Worksheet相同)，替身實作這些方法即可：
+#   get_all_values()、col_values(col)、append_row(values)、append_rows(rows, table_range=)、update(range, values)、
+#   batch_update([{"range": ..., "values": ...}])、clear()
+#後端另外要有forget(spreadsheet_id, sheet_name)：寫入失敗時丟掉快取的分頁，下次重新開啟
+#錯誤一律丟出gspread.exceptions.APIError，讓sync.py的錯誤處理不用分辨後端
+#benchmarks/fake_sheets.py有記錄每次呼叫、可限制每分鐘次數的記憶體版本
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+
+class GspreadBackend:
+    #整個程式共用一個已授權的client：credentials.json只讀一次，權杖快過期前自動更新
+    #開過的試算表與分頁也留著重複使用，不用每次同步都open_by_key
+    def __init__(self, credentials_path=CREDENTIALS_PATH, refresh_margin=SHEETS_TOKEN_REFRESH_MARGIN):
+        self.credentials_path = credentials_path
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._gc = None
+        self._spreadsheets = {}     # spreadsheet_id → gspread.Spreadsheet
+        self._worksheets = {}       # (spreadsheet_id, sheet_name) → gspread.Worksheet
+
+    def _client(self):
+        with self._lock:
+            if self._gc is None:
+                self._credentials = Credentials.from_service_account_file(self.credentials_path, scopes=SCOPES)
+                self._gc = gspread.authorize(self._credentials)
+            credentials = self._credentials
+            #google-auth的expiry是不含時區的UTC時間
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            if not credentials.valid or (credentials.expiry and credentials.expiry - now < self.refresh_margin):
+                credentials.refresh(Request())
+            return self._gc
+
+    def open_worksheet(self, spreadsheet_id, sheet_name, rows=1000, cols=40):
+        #取得分頁，不存在時建立
+        key = (spreadsheet_id, sheet_name)
+        with self._lock:
+            gc = self._client()
+            if key in self._worksheets:
+                return self._worksheets[key]
+            sh = self._spreadsheets.get(spreadsheet_id)
+            if sh is None:
+                sh = self._spreadsheets[spreadsheet_id] = gc.open_by_key(spreadsheet_id)
+            try:
+                worksheet = sh.worksheet(sheet_name)
+            except gspread.exceptions.WorksheetNotFound:
+                worksheet = sh.add_worksheet(title=sheet_name, rows=str(rows), cols=str(cols))
+            self._worksheets[key] = worksheet
+            return worksheet
+
+    def forget(self, spreadsheet_id, sheet_name):
+        #分頁可能被刪除或改名，丟掉快取的handle
+        with self._lock:
+            self._worksheets.pop((spreadsheet_id, sheet_name), None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_executor = None
+
+
+def get_sheet_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = GspreadBackend()
+        return _backend
+
+
+def set_sheet_backend(backend):
+    #換成其他後端(例如benchmark的記憶體替身)，傳None恢復成gspread
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def submit_sheet_job(fn, *args, **kwargs):
+    #所有google sheet工作共用同一個執行緒池(最多SHEETS_MAX_WORKERS個)，回傳Future
+    global _executor
+    with _backend_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SHEETS_MAX_WORKERS, thread_name_prefix="sheets")
+        return _executor.submit(fn, *args, **kwargs)
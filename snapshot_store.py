@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from config import SNAPSHOT_DB_PATH, FRESHNESS_TTL
+from metric_record import MetricRecord
+
+#每次爬蟲抓到的每一個數值都存進APPDATA底下的SQLite，作為資料的正式來源(system of record)
+#EXCEL與google sheet只是這份資料「每檔股票最新值」的輸出畫面，需要時可以不連網重建，也能查詢過去的數值
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    ticker TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period TEXT NOT NULL,
+    value TEXT,
+    fetched_at TEXT NOT NULL,
+    crawl_id INTEGER REFERENCES crawls (id)
+);
+CREATE INDEX IF NOT EXISTS idx_metrics_lookup ON metrics (ticker, metric, period, fetched_at);
+CREATE TABLE IF NOT EXISTS page_fetches (
+    ticker TEXT NOT NULL,
+    page TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, page)
+);
+"""
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DB_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        #舊版資料庫沒有number欄位(抓取時解析好的數值)，補上
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(metrics)")]
+        if "number" not in columns:
+            self._conn.execute("ALTER TABLE metrics ADD COLUMN number REAL")
+            self._conn.commit()
+
+    def begin_crawl(self):
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO crawls (started_at) VALUES (?)", (_now(),))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def finish_crawl(self, crawl_id):
+        with self._lock:
+            self._conn.execute("UPDATE crawls SET finished_at = ? WHERE id = ?", (_now(), crawl_id))
+            self._conn.commit()
+
+    def record(self, crawl_id, ticker, records, pages=None):
+        #記錄一檔股票這次抓到的所有MetricRecord(原始文字與解析後的數值都存)
+        #pages為這次抓到資料的頁面，用來判斷下次是否需要重新抓
+        code = ticker.strip().upper()
+        fetched_at = _now()
+        rows = [(code, r.metric, r.period, r.text, fetched_at, crawl_id, r.value) for r in records]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO metrics (ticker, metric, period, value, fetched_at, crawl_id, number) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO page_fetches VALUES (?, ?, ?)",
+                                   [(code, page, fetched_at) for page in pages or ()])
+            self._conn.commit()
+
+    def record_crawl(self, records, fetched_pages=None):
+        #records為這次爬蟲所有股票的MetricRecord，fetched_pages為 {ticker: 抓到資料的頁面}
+        by_ticker = {ticker: [] for ticker in (fetched_pages or {})}
+        for record in records:
+            by_ticker.setdefault(record.ticker, []).append(record)
+        crawl_id = self.begin_crawl()
+        for ticker, ticker_records in by_ticker.items():
+            self.record(crawl_id, ticker, ticker_records, (fetched_pages or {}).get(ticker))
+        self.finish_crawl(crawl_id)
+        return crawl_id
+
+    def last_refreshed(self, tickers, pages=FRESHNESS_TTL):
+        #每檔股票最久沒更新的那一頁的抓取時間，任何一頁從沒抓過時為None
+        tickers = [t.strip().upper() for t in tickers]
+        result = dict.fromkeys(tickers)
+        if not tickers:
+            return result
+        sql = f"""
+            SELECT ticker, MIN(fetched_at), COUNT(*) FROM page_fetches
+            WHERE ticker IN ({', '.join('?' * len(tickers))}) AND page IN ({', '.join('?' * len(pages))})
+            GROUP BY ticker
+        """
+        with self._lock:
+            for ticker, oldest, count in self._conn.execute(sql, tickers + list(pages)):
+                if count == len(pages):
+                    result[ticker] = oldest
+        return result
+
+    def pages_to_refresh(self, tickers, ttl=FRESHNESS_TTL):
+        """
+        依每一類頁面的新鮮度設定，回傳 {ticker: 需要重新抓的頁面set}
+        從沒抓過、或上次抓取已超過ttl秒的頁面才需要抓；ttl為0的頁面每次都抓
+        """
+        tickers = [t.strip().upper() for t in tickers]
+        last = {}
+        if tickers:
+            sql = f"SELECT ticker, page, fetched_at FROM page_fetches WHERE ticker IN ({', '.join('?' * len(tickers))})"
+            with self._lock:
+                for ticker, page, fetched_at in self._conn.execute(sql, tickers):
+                    last[(ticker, page)] = fetched_at
+        now = datetime.now()
+        plan = {}
+        for ticker in tickers:
+            plan[ticker] = set()
+            for page, seconds in ttl.items():
+                fetched_at = last.get((ticker, page))
+                cutoff = (now - timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S.%f")
+                if not seconds or fetched_at is None or fetched_at < cutoff:
+                    plan[ticker].add(page)
+        return plan
+
+    def latest(self, tickers=None):
+        """
+        回傳每檔股票最新的資料，格式與爬蟲結果相同：MetricRecord陣列
+        每個metric只取最近一次抓取的那一批period，已經不在網站上的舊年份不會混進來
+        tickers有給時依tickers的順序輸出，沒有資料的代碼略過
+        """
+        params = []
+        where = ""
+        if tickers is not None:
+            tickers = [t.strip().upper() for t in tickers]
+            if not tickers:
+                return []
+            where = f"WHERE ticker IN ({', '.join('?' * len(tickers))})"
+            params = tickers
+        sql = f"""
+            SELECT m.ticker, m.metric, m.period, m.value, m.number
+            FROM metrics m
+            JOIN (SELECT ticker, metric, MAX(fetched_at) AS ts FROM metrics {where} GROUP BY ticker, metric) l
+              ON m.ticker = l.ticker AND m.metric = l.metric AND m.fetched_at = l.ts
+        """
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        values = {}
+        for ticker, metric, period, text, number in rows:
+            values.setdefault(ticker, []).append(MetricRecord(ticker, metric, period, text, number))
+
+        records = []
+        for ticker in dict.fromkeys(tickers if tickers is not None else sorted(values)):
+            records.extend(values.get(ticker, ()))
+        return records
+
+    def history(self, ticker, metric, period=None):
+        #查詢某個數值歷次抓取的紀錄：[(fetched_at, period, value), ...]
+        sql = "SELECT fetched_at, period, value FROM metrics WHERE ticker = ? AND metric = ?"
+        params = [ticker.strip().upper(), metric]
+        if period is not None:
+            sql += " AND period = ?"
+            params.append(period)
+        with self._lock:
+            return self._conn.execute(sql + " ORDER BY fetched_at", params).fetchall()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore()
+        return _store
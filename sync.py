@@ -1,12 +1,15 @@
 import gspread
-from google.oauth2.service_account import Credentials
 import threading
 import queue
 import time
 import re
+import json
 from datetime import datetime
-from tkinter import messagebox
-from config import CREDENTIALS_PATH, EXCEL_PATH
+from config import SHEET_SNAPSHOT_DIR, SHEET_SNAPSHOT_MAX_AGE
+from run_metrics import get_metrics
+from sheet_backend import get_sheet_backend, submit_sheet_job
+from metric_record import NAME_METRIC
+from column_schema import ColumnSchema, TICKER_COLUMN, TIMESTAMP_COLUMN
 
 _group_queue = queue.Queue()
 _latest_groups = None
@@ -19,200 +22,250 @@ def get_column_letter(n):
         result = chr(65 + rem) + result
     return result
 
-#將EXCEL的標題欄位從網頁原始格式轉成自定義
-def clean_column_name(name):
-    if name == "公司名稱":
-        return name
-
-    #處理EPS、FREE CASH FLOW、DEBT + TTM
-    #正則表達式比對EPS (TTM) 或 Free Cash Flow (TTM) 或 Total Debt (TTM)
-    #.*萬用字元
-    match_ttm = re.search(r"(EPS|Free Cash Flow|Total Debt).*\(TTM\)", name)
-    if match_ttm:
-        #如果比對成功，將字串修改為 EPS(TTM)、Free Cash Flow(TTM)、Total Debt(TTM)
-        return f"{match_ttm.group(1)}(TTM)"
-
-    #處理FY年份欄位
-    # 正則表達式比對EPS (年分) 或 Free Cash Flow (年分) 或 Total Debt (年分)
-    #\d{4} 表西元年
-    match_year = re.search(r"(EPS|Free Cash Flow|Total Debt).*?\(FY (\d{4})\)", name)
-    if match_year:
-        return f"{match_year.group(1)}({match_year.group(2)})"
-
-    return name.strip()
-
-def extract_year(col):
-    match = re.search(r"\((TTM|\d{4})\)", col)
-    #如果有抓到TTM或是年分
-    if match:
-        val = match.group(1)
-        #如果是TTM則回傳9999、如果是年份則回傳年分、如果都不是則回傳-1
-        return 9999 if val == "TTM" else int(val)
-    return -1
-
-
-def sort_headers_with_priority(headers, priority_list):
-    headers_set = set(headers)
-    ordered = []
-    for col in priority_list:
-        if col in headers_set:
-            ordered.append(col)
-    for col in headers:
-        if col not in ordered:
-            ordered.append(col)
-    return ordered
-
+#google sheet內容的本地快照：{"saved_at": 秒數, "rows": 含標題列的二維陣列}
+#每次寫入成功後更新，寫入失敗或超過SHEET_SNAPSHOT_MAX_AGE就視為失效，下次重新讀取整頁
+def _sheet_snapshot_path(spreadsheet_id, sheet_name):
+    safe_name = re.sub(r"[^\w.-]", "_", f"{spreadsheet_id}_{sheet_name}")
+    return SHEET_SNAPSHOT_DIR / f"{safe_name}.json"
+
+def load_sheet_snapshot(spreadsheet_id, sheet_name):
+    path = _sheet_snapshot_path(spreadsheet_id, sheet_name)
+    try:
+        snapshot = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if time.time() - snapshot.get("saved_at", 0) > SHEET_SNAPSHOT_MAX_AGE:
+        return None
+    return snapshot.get("rows")
+
+def save_sheet_snapshot(spreadsheet_id, sheet_name, rows):
+    path = _sheet_snapshot_path(spreadsheet_id, sheet_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"saved_at": time.time(), "rows": rows}, ensure_ascii=False), encoding="utf-8")
+
+def invalidate_sheet_snapshot(spreadsheet_id, sheet_name):
+    _sheet_snapshot_path(spreadsheet_id, sheet_name).unlink(missing_ok=True)
+
+#寫入失敗時不知道分頁現在的狀態：丟掉本地快照與快取的分頁handle，下次重新讀取
+def _discard_sheet_state(spreadsheet_id, sheet_name):
+    invalidate_sheet_snapshot(spreadsheet_id, sheet_name)
+    get_sheet_backend().forget(spreadsheet_id, sheet_name)
+
+#比對同一列新舊內容，回傳batch_update用的範圍，只包含有變動的連續儲存格
+def diff_row_ranges(old_row, new_row, row_num):
+    ranges = []
+    start = None
+    for idx, val in enumerate(new_row + [None]):
+        changed = val is not None and (idx >= len(old_row) or str(old_row[idx]) != str(val))
+        if changed and start is None:
+            start = idx
+        elif not changed and start is not None:
+            ranges.append({
+                "range": f"{get_column_letter(start + 1)}{row_num}:{get_column_letter(idx)}{row_num}",
+                "values": [new_row[start:idx]],
+            })
+            start = None
+    return ranges
+
+
+#代碼欄(A欄)的內容，去掉空白與最後面的空格，跟col_values(1)的結果一致
+def _trim_column(values):
+    column = [str(value).strip() for value in values]
+    while column and not column[-1]:
+        column.pop()
+    return column
+
+def _first_column(rows):
+    return _trim_column(row[0] if row else "" for row in rows)
+
+
+#呼叫Sheets API並記錄次數與耗時
+def _sheets_call(fn, *args, **kwargs):
+    metrics = get_metrics()
+    metrics.incr("sheets_api_calls")
+    with metrics.timer("sheets_api"):
+        return fn(*args, **kwargs)
+
+#records為MetricRecord陣列，同一檔股票的records寫到同一列
+#schema為column_schema.ColumnSchema，跟EXCEL共用時由呼叫端傳入，沒傳時由records建立
+#timestamp為寫入「更新時間」欄的文字，沒傳時為現在時間(同一次寫入的每一列都相同)
 def smart_write_to_google_sheet(
-    data_rows,
-    extra_data_dict=None,
+    records,
     spreadsheet_id=None,
     sheet_name="Crawl_data",
     log_fn=None,
+    schema=None,
+    timestamp=None,
 ):
+    log_fn = log_fn or print
+    schema = schema or ColumnSchema(records)
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
     def do_update():
         if not spreadsheet_id:
             log_fn(f"❌ 未寫入 Spreadsheet ID")
-            return
-
-        credentials = Credentials.from_service_account_file(
-            CREDENTIALS_PATH,
-            scopes=["https://www.googleapis.com/auth/spreadsheets"]
-        )
-        gc = gspread.authorize(credentials)
-        sh = gc.open_by_key(spreadsheet_id)
+            return False
 
         try:
-            worksheet = sh.worksheet(sheet_name)
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = sh.add_worksheet(title=sheet_name, rows="1000", cols="40")
-
-        rows = worksheet.get_all_values()
+            worksheet = _sheets_call(get_sheet_backend().open_worksheet, spreadsheet_id, sheet_name, rows=1000, cols=40)
+        except gspread.exceptions.APIError as e:
+            log_fn(f"⚠️ 開啟 {sheet_name} 分頁發生錯誤：{e}")
+            return False
+
+        #優先使用本地快照，沒有快照(或已失效)時才整頁讀取
+        #分頁可能被手動排序、插入/刪除列或由其他程式寫入，所以每次都重新讀一次代碼欄(A欄)
+        #代碼欄決定每檔股票在第幾列，快照只用來比對儲存格內容；代碼欄跟快照對不上時捨棄快照，整頁重讀
+        rows = load_sheet_snapshot(spreadsheet_id, sheet_name)
+        if rows is None:
+            rows = _sheets_call(worksheet.get_all_values)
+            ticker_column = _first_column(rows)
+        else:
+            ticker_column = _trim_column(_sheets_call(worksheet.col_values, 1))
+            if ticker_column != _first_column(rows):
+                log_fn(f"🔄 {sheet_name} 分頁的列順序已變動，重新讀取整頁")
+                invalidate_sheet_snapshot(spreadsheet_id, sheet_name)
+                rows = _sheets_call(worksheet.get_all_values)
+                ticker_column = _first_column(rows)
         current_headers = rows[0] if rows else []
 
-        static_cols = ["股票代碼", "公司名稱", "SharesOut", "PE Ratio", "Price Target"]
-
-        dynamic_keys = set()
-        if extra_data_dict:
-            for val in extra_data_dict.values():
-                for key in val:
-                    if key != "公司名稱":
-                        dynamic_keys.add(key)
-
-        cleaned_keys = [clean_column_name(key) for key in dynamic_keys]
-        sorted_dynamic_cols = sorted(
-            cleaned_keys, key=lambda c: -extract_year(c) if extract_year(c) != -1 else 0
-        )
-
-        #標題順序
-        desired_order = [
-            "股票代碼", "公司名稱", "SharesOut", "PE Ratio", "Price Target",
-            "EPS(TTM)", "EPS(2025)", "EPS(2024)", "EPS(2023)", "EPS(2022)", "EPS(2021)", "EPS(2020)",
-            "Free Cash Flow(TTM)", "Free Cash Flow(2025)","Free Cash Flow(2024)", "Free Cash Flow(2023)", "Free Cash Flow(2022)","Free Cash Flow(2021)","Free Cash Flow(2020)",
-            "Total Debt(TTM)","Total Debt(2025)","Total Debt(2024)", "Total Debt(2023)","Total Debt(2022)","Total Debt(2021)","Total Debt(2020)", "更新時間"
-        ]
-
-        # 先建立欄位集合，包含資料出現過的欄位
-        raw_all_headers = static_cols + sorted_dynamic_cols + ["更新時間"]
-
-        # 若有desired_order有出現但raw_all_headers沒有則append在後面
-        for col in desired_order:
-            if col not in raw_all_headers:
-                raw_all_headers.append(col)
-
-        #依據上面的順序排列標題
-        all_headers = sort_headers_with_priority(raw_all_headers, desired_order)
-
-        if current_headers != all_headers:
-            if not current_headers:
-                worksheet.append_row(all_headers)
-            else:
-                worksheet.update("A1", [all_headers])
+        #標題：這次資料的欄位加上分頁中既有的欄位，依schema的規則排序
+        all_headers = schema.order(current_headers)
+
+        #標題變動時(例如出現新的會計年度)既有列的欄位位置不再可信，所有既有列改為整列重寫
+        old_headers = current_headers
+        headers_changed = current_headers != all_headers
+        if headers_changed:
+            try:
+                if not current_headers:
+                    _sheets_call(worksheet.append_row, all_headers)
+                else:
+                    _sheets_call(worksheet.update, "A1", [all_headers])
+            except gspread.exceptions.APIError as e:
+                _discard_sheet_state(spreadsheet_id, sheet_name)
+                log_fn(f"⚠️ 寫入 Crawl_data 標題發生錯誤：{e}")
+                return False
             current_headers = all_headers
 
         col_index_map = {col: idx + 1 for idx, col in enumerate(current_headers)}
-        existing_rows = worksheet.get_all_values()[1:]
+        existing_rows = [list(row) for row in rows[1:]]
+        if headers_changed and old_headers:
+            #既有列依新標題重新排列，沒有這次資料的列也要跟著搬到新的欄位
+            old_index = {name: idx for idx, name in enumerate(old_headers) if name}
+            existing_rows = [
+                [row[old_index[col]] if old_index.get(col, len(row)) < len(row) else "" for col in current_headers]
+                for row in existing_rows
+            ]
 
         code_to_row = {
-            row[0].strip().upper(): idx + 2
-            for idx, row in enumerate(existing_rows)
-            if row and row[0].strip()
+            code.upper(): idx + 1
+            for idx, code in enumerate(ticker_column)
+            if idx > 0 and code
         }
 
-        for code, shares, pe, pt in data_rows:
+        #所有更新先在記憶體中組好，最後一次batch_update既有列、一次append_rows新增列
+        #既有列只送出跟快照不同的儲存格(連續的儲存格合併成一個範圍)
+        #新增列會接在目前最後一列之後，所以可以直接算出每一檔會落在第幾列
+        updates = []
+        unchanged = 0
+        appends = []
+        pending_appends = {}
+        placements = []
+        next_row = max(len(existing_rows) + 1, len(ticker_column)) + 1
+        written_rows = set()
+
+        value_columns = [(column, idx) for column, idx in col_index_map.items()
+                         if column not in (TICKER_COLUMN, TIMESTAMP_COLUMN)]
+        for code in schema.tickers():
             code_key = code.strip().upper()
-            extra = extra_data_dict.get(code, {}) if extra_data_dict else {}
-            company_name = extra.get("公司名稱", "-")
+            company_name = schema.cell(code, NAME_METRIC)
 
             row_data = [""] * len(current_headers)
-            row_data[col_index_map["股票代碼"] - 1] = code
-            row_data[col_index_map["公司名稱"] - 1] = company_name
-            row_data[col_index_map["SharesOut"] - 1] = shares
-            row_data[col_index_map["PE Ratio"] - 1] = pe
-            row_data[col_index_map["Price Target"] - 1] = pt
-
-            for cleaned_key in col_index_map:
-                if cleaned_key in static_cols or cleaned_key == "更新時間":
-                    continue  # 靜態欄位交由前面處理
-
-                # 嘗試從 extra 資料中找對應的原始 key
-                raw_match = next((rk for rk in extra if clean_column_name(rk) == cleaned_key), None)
-
-                if raw_match:
-                    val = extra.get(raw_match)
-                    row_data[col_index_map[cleaned_key] - 1] = val if val not in [None, "", "NA", "N/A"] else "-"
-                else:
-                    row_data[col_index_map[cleaned_key] - 1] = "-"
-
-            row_data[col_index_map["更新時間"] - 1] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            try:
-                if code_key in code_to_row:
-                    row_num = code_to_row[code_key]
-                    end_col_letter = get_column_letter(len(current_headers))
-                    cell_range = f"A{row_num}:{end_col_letter}{row_num}"
-                    worksheet.update(cell_range, [row_data])
-                    log_fn(f"📌 Renew{code}|{company_name} to {row_num} row")
-                else:
-                    worksheet.append_row(row_data)
-                    existing_rows = worksheet.get_all_values()[1:]
-                    new_row = len(existing_rows) + 1  # 或 +2，看你 header 是否包含在內
-                    log_fn(f"➕ add{code}|{company_name} to {new_row} row")
-
+            row_data[col_index_map[TICKER_COLUMN] - 1] = code
+            for column, idx in value_columns:
+                row_data[idx - 1] = schema.cell(code, column)
+            row_data[col_index_map[TIMESTAMP_COLUMN] - 1] = timestamp
+
+            if code_key in pending_appends:
+                #同一批重複出現的新代碼只新增一次，以最後一次的資料為準
+                appends[pending_appends[code_key]] = row_data
+            elif code_key in code_to_row:
+                row_num = code_to_row[code_key]
+                written_rows.add(row_num)
+                old_row = [] if headers_changed else existing_rows[row_num - 2]
+                ranges = diff_row_ranges(old_row, row_data, row_num)
+                existing_rows[row_num - 2] = row_data
+                if not ranges:
+                    unchanged += 1
+                    continue
+                updates.extend(ranges)
+                cells = sum(len(r["values"][0]) for r in ranges)
+                placements.append(f"📌 Renew{code}|{company_name} to {row_num} row（{cells} cells）")
+            else:
+                row_num = next_row
+                next_row += 1
+                pending_appends[code_key] = len(appends)
+                appends.append(row_data)
+                placements.append(f"➕ add{code}|{company_name} to {row_num} row")
+
+        if headers_changed:
+            moved = [(idx + 2, row) for idx, row in enumerate(existing_rows) if idx + 2 not in written_rows and any(row)]
+            for row_num, row in moved:
+                updates.extend(diff_row_ranges([], row, row_num))
+            if moved:
+                placements.append(f"↔ {len(moved)} rows moved to new columns")
 
+        try:
+            if updates:
+                _sheets_call(worksheet.batch_update, updates)
+            if appends:
+                _sheets_call(worksheet.append_rows, appends, table_range="A1")
+        except gspread.exceptions.APIError as e:
+            #寫入失敗時不知道哪些已經寫進去，丟掉快照，下次重新讀取整頁
+            _discard_sheet_state(spreadsheet_id, sheet_name)
+            log_fn(f"⚠️ 寫入 Crawl_data 發生錯誤（{len(updates)} 個範圍、{len(appends)} 筆新增）：{e}")
+            return False
+
+        save_sheet_snapshot(spreadsheet_id, sheet_name, [current_headers] + existing_rows + appends)
+        for line in placements:
+            log_fn(line)
+        if unchanged:
+            log_fn(f"⏭ {unchanged} rows unchanged")
+        return True
+
+    def run():
+        try:
+            return do_update() is True
+        except Exception as e:
+            _discard_sheet_state(spreadsheet_id, sheet_name)
+            log_fn(f"⚠️ 寫入 {sheet_name} 發生錯誤：{e}")
+            return False
 
-            except gspread.exceptions.APIError as e:
-                log_fn(f"⚠️ 寫入 {code} |{company_name}發生錯誤：{e}")
+    #在google sheet執行緒池中執行，回傳Future：result()等待寫入完成並回傳是否成功
+    return submit_sheet_job(run)
 
-    threading.Thread(target=do_update, daemon=True).start()
+def sync_group_to_google_sheet(groups_dict, spreadsheet_id, sheet_name="Group", log_fn=None):
+    log_fn = log_fn or print
 
-def sync_group_to_google_sheet(groups_dict, spreadsheet_id, sheet_name="Group"):
     def do_sync():
-        credentials = Credentials.from_service_account_file(
-            CREDENTIALS_PATH,
-            scopes=["https://www.googleapis.com/auth/spreadsheets"]
-        )
-        gc = gspread.authorize(credentials)
-
-        try:
-            sh = gc.open_by_key(spreadsheet_id)
-            if sheet_name in [ws.title for ws in sh.worksheets()]:
-                worksheet = sh.worksheet(sheet_name)
-                worksheet.clear()
-            else:
-                worksheet = sh.add_worksheet(title=sheet_name, rows="100", cols="30")
-        except Exception as e:
-            print(f"❌ 同步 Group 分頁失敗：{e}")
-            return
-
         max_len = max((len(codes) for codes in groups_dict.values()), default=0)
         rows = [list(groups_dict.keys())]
         for i in range(max_len):
             row = [groups_dict[g][i] if i < len(groups_dict[g]) else "" for g in groups_dict]
             rows.append(row)
 
-        worksheet.update("A1", rows)
-
-    threading.Thread(target=do_sync, daemon=True).start()
+        try:
+            worksheet = _sheets_call(get_sheet_backend().open_worksheet, spreadsheet_id, sheet_name, rows=100, cols=30)
+            _sheets_call(worksheet.clear)
+            _sheets_call(worksheet.update, "A1", rows)
+        except Exception as e:
+            #在執行緒池中丟出的例外不會顯示，這裡直接記錄
+            get_sheet_backend().forget(spreadsheet_id, sheet_name)
+            log_fn(f"❌ 同步 Group 分頁失敗：{e}")
+            return False
+        return True
+
+    #回傳Future，result()等待同步完成並回傳是否成功
+    return submit_sheet_job(do_sync)
 
 def _group_sync_worker(spreadsheet_id, sheet_name="Group"):
     global _latest_groups
@@ -0,0 +1,58 @@
+import queue
+from config import UI_REFRESH_MS, UI_MAX_EVENTS_PER_FRAME
+
+#背景執行緒不能直接碰tkinter元件，一律把log、進度與其他畫面更新丟進這個queue
+#Tk主迴圈每UI_REFRESH_MS毫秒用root.after取出一批：log合併成一次insert，進度只套用最後一筆
+
+
+class UIQueue:
+    def __init__(self, root, on_log, on_progress, interval=UI_REFRESH_MS, max_events=UI_MAX_EVENTS_PER_FRAME):
+        self.root = root
+        self.on_log = on_log                # on_log(lines)：一次寫入多行log
+        self.on_progress = on_progress      # on_progress(done, total)
+        self.interval = interval
+        self.max_events = max_events
+        self._queue = queue.SimpleQueue()
+
+    def start(self):
+        self.root.after(self.interval, self._drain)
+
+    def log(self, line):
+        self._queue.put(("log", line))
+
+    def progress(self, done, total):
+        self._queue.put(("progress", done, total))
+
+    def call(self, fn, *args, **kwargs):
+        #其他需要在主執行緒執行的畫面更新(例如改label文字)
+        self._queue.put(("call", fn, args, kwargs))
+
+    def _drain(self):
+        lines = []
+        progress = None
+        try:
+            for _ in range(self.max_events):
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                kind = event[0]
+                if kind == "log":
+                    lines.append(event[1])
+                elif kind == "progress":
+                    progress = event[1:]
+                else:
+                    #call要照順序執行，先把前面累積的log與進度送出去
+                    if lines:
+                        self.on_log(lines)
+                        lines = []
+                    if progress:
+                        self.on_progress(*progress)
+                        progress = None
+                    event[1](*event[2], **event[3])
+            if lines:
+                self.on_log(lines)
+            if progress:
+                self.on_progress(*progress)
+        finally:
+            self.root.after(self.interval, self._drain)